@@ -1,28 +1,37 @@
+import asyncio
+import base64
+import json
 from typing import Any, Optional
 from fastapi import APIRouter
 from fastapi.encoders import jsonable_encoder
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
+from cache import analytics_cache, analytics_flight, delta_states, summary_flight
+from dataset_stats import restaurant_count
+from operations import SUMMARY_PIPELINES, get_summary
 from database import db
 from models import FilterParams
-from database import collection
+from database import aggregate_options, analytics_collection, collection
 from models import FilterLocationParams
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Query, Request
+from bson import ObjectId
+from pymongo.errors import ExecutionTimeout
+from columnar import active_engine
+from spatial import candidate_ids, lon_ranges
+from tiles import CELL_SUMS, cluster_cell_size, cluster_columns, read_cluster_tiles, tile_key, tiles_ready
+from utils import dumps
+from metrics import span, timed
+from executors import run_cpu
+from sampling import APPROX_MAX_ZOOM, sample_facets, sample_ready
+from formats import JSON, encode, is_columnar, listing_columns, negotiate
+from vocabulary import (decode_items, decode_lists, encode_labels, load_vocabulary, refresh_for_codes,
+                        refresh_for_labels)
+from delta import apply_facets, finalize, load_state, new_state, plan_delta, save_state, strips_match
 import math
+from datetime import timezone
+from email.utils import format_datetime
 
 router = APIRouter()
 
-def sanitize(obj: Any) -> Any:
-    """
-    Recursively replace NaN or infinite floats with None so JSON serialization won't fail.
-    """
-    if isinstance(obj, dict):
-        return {k: sanitize(v) for k, v in obj.items()}
-    if isinstance(obj, list):
-        return [sanitize(v) for v in obj]
-    if isinstance(obj, float) and (math.isnan(obj) or math.isinf(obj)):
-        return None
-    return obj
-
 def is_valid_filter_value(value: Any) -> bool:
     """
     Returns False for None, empty string, "string", or empty list.
@@ -39,8 +48,569 @@ def is_valid_filter_value(value: Any) -> bool:
         )
     return True
 
+# filters backed by a compound (field, latitude, longitude) index
+EQUALITY_FIELDS = (
+    "country", "city", "province", "price_level_cat",
+    "meals_list", "cuisines_list", "top_tags_list",
+)
+
+# (FilterParams field, dictionary-encoded document field)
+LIST_FILTERS = (
+    ("meal_list", "meals_list"),
+    ("cuisines_list", "cuisines_list"),
+    ("top_tags_list", "top_tags_list"),
+)
+
+def build_filter_stage(filters: FilterParams) -> dict:
+    """
+    Translate the valid FilterParams into MongoDB conditions (no bounding box).
+    """
+    match_stage: dict = {}
+    if is_valid_filter_value(filters.country):
+        match_stage["country"] = (
+            {"$in": filters.country}
+            if isinstance(filters.country, list)
+            else filters.country
+        )
+    for fld in ("city", "province", "claimed", "price_level_cat"):
+        v = getattr(filters, fld)
+        if is_valid_filter_value(v):
+            match_stage[fld] = v
+    for fld in ("service", "food"):
+        v = getattr(filters, fld)
+        if v is not None and v > 0:
+            match_stage[fld] = {"$gte": v}
+    for filt, dbf in LIST_FILTERS:
+        vals = getattr(filters, filt)
+        if is_valid_filter_value(vals):
+            # the documents store dictionary codes (see vocabulary)
+            match_stage[dbf] = {"$in": encode_labels(dbf, vals)}
+    return match_stage
+
+
+async def refresh_filter_codes(filters: FilterParams):
+    """
+    Make sure every list filter label that has a code anywhere has it here,
+    so the filter (and its cache key) never uses a stale dictionary.
+    """
+    for filt, dbf in LIST_FILTERS:
+        vals = getattr(filters, filt)
+        if is_valid_filter_value(vals):
+            await refresh_for_labels(dbf, vals)
+
+
+def build_match_stage(
+    filters: FilterParams,
+    north: float,
+    south: float,
+    east: float,
+    west: float,
+) -> dict:
+    """
+    Translate FilterParams plus the bounding box into a MongoDB $match stage.
+    """
+    match_stage = build_filter_stage(filters)
+
+    # bounding box; without equality filters the 2d index on location is the
+    # most selective access path, the lat/lon ranges keep the exact semantics
+    match_stage["latitude"] = {"$gte": south, "$lte": north}
+    if west > east:
+        # viewport crossing the antimeridian: two longitude intervals
+        match_stage["$or"] = [
+            {"longitude": {"$gte": w, "$lte": e}} for w, e in lon_ranges(east, west)
+        ]
+        return match_stage
+    if not any(k in match_stage for k in EQUALITY_FIELDS):
+        match_stage["location"] = {"$geoWithin": {"$box": [[west, south], [east, north]]}}
+    match_stage["longitude"] = {"$gte": west,  "$lte": east}
+    return match_stage
+
+
+# _id is read for the keyset token and removed before responding
+LISTING_PROJECTION = {
+    "name": 1,
+    "city": 1,
+    "country": 1,
+    "latitude": 1,
+    "longitude": 1,
+    "avg_rating": 1,
+    "price_level_cat": 1,
+    "claimed": 1,
+    "vegan_options": 1,
+    "gluten_free": 1,
+    "meals_list": 1,
+    "top_tags_list": 1
+}
+
+
+def stats_facet() -> list:
+    """
+    Sub-pipeline with the overall sums and counts of the matched documents.
+    Groups on the vegan/gluten/valid_rating/price_numeric fields stored at ingest.
+    """
+    return [
+        {"$group": {
+            "_id": None,
+            "total":             {"$sum": 1},
+            "vegan_count":       {"$sum":{"$cond":["$vegan", 1, 0]}},
+            "gluten_free_count": {"$sum":{"$cond":["$gluten",1,0]}},
+            "rating_sum":        {"$sum":{"$ifNull":["$valid_rating",0]}},
+            "rating_count":      {"$sum":{"$cond":[{"$ne":["$valid_rating",None]},1,0]}},
+            "premium_count":     {"$sum":{"$cond":[{"$eq":["$price_numeric",3]},1,0]}},
+            "price_sum":         {"$sum":{"$ifNull":["$price_numeric",0]}},
+            "price_count":       {"$sum":{"$cond":[{"$ne":["$price_numeric",None]},1,0]}}
+        }}
+    ]
+
+
+def distribution_facet(field: str, label: str) -> list:
+    """
+    Sub-pipeline counting the values of a list field, e.g. meals_list → meal.
+    """
+    return [
+        {"$unwind": f"${field}"},
+        {"$group": {"_id": f"${field}", "count": {"$sum": 1}}},
+        {"$project": {"_id": 0, label: "$_id", "count": 1}}
+    ]
+
+
+async def decode_distributions(res: dict) -> dict:
+    """
+    Meal and tag codes of a facet result back to labels, in place.
+    """
+    for field, label in (("meals_list", "meal"), ("top_tags_list", "tag")):
+        items = res.get(field, [])
+        await refresh_for_codes(field, (item[label] for item in items))
+        decode_items(field, items, label)
+    return res
+
+
+def cluster_facet(cell_size: float, limit: int) -> list:
+    """
+    Sub-pipeline grouping the matched documents into grid cells of cell_size degrees.
+    """
+    return [
+        # compute grid cell
+        {"$addFields": {
+            "cellX": {"$floor": {"$divide":[{"$add":["$longitude",180]}, cell_size]}},
+            "cellY": {"$floor": {"$divide":[{"$add":["$latitude",  90]}, cell_size]}}
+        }},
+
+        # group per cell
+        {"$group": {
+            "_id":               {"x":"$cellX","y":"$cellY"},
+            "total_restaurants": {"$sum":1},
+            "latitude":          {"$avg":"$latitude"},
+            "longitude":         {"$avg":"$longitude"},
+            "vegan_count":       {"$sum":{"$cond":["$vegan",1,0]}},
+            "gluten_free_count": {"$sum":{"$cond":["$gluten",1,0]}},
+            "avgRatingCluster":  {"$avg":"$valid_rating"},
+            "avgPriceCluster":   {"$avg":"$price_numeric"},
+            "premium_count":     {"$sum":{"$cond":[{"$eq":["$price_numeric",3]},1,0]}}
+        }},
+
+        # final shape with percentages
+        {"$project": {
+            "_id":                0,
+            "total_restaurants":  1,
+            "latitude":           {"$round":["$latitude",6]},
+            "longitude":          {"$round":["$longitude",6]},
+            "vegan_count":        1,
+            "pct_vegan":          {"$round":[{"$multiply":[{"$divide":["$vegan_count","$total_restaurants"]},100]},2]},
+            "gluten_free_count":  1,
+            "pct_gluten_free":    {"$round":[{"$multiply":[{"$divide":["$gluten_free_count","$total_restaurants"]},100]},2]},
+            "avg_rating":         {"$round":["$avgRatingCluster",2]},
+            "pct_avg_rating":     {"$round":[{"$multiply":[{"$divide":["$avgRatingCluster",5]},100]},2]},
+            "premium_count":      1,
+            "pct_premium":        {"$round":[{"$multiply":[{"$divide":["$premium_count","$total_restaurants"]},100]},2]},
+            "avg_price_category": {"$switch":{
+                                      "branches":[
+                                          {"case":{"$lt":["$avgPriceCluster",1.5]},"then":"barato"},
+                                          {"case":{"$lt":["$avgPriceCluster",2.5]},"then":"regular"}
+                                      ],
+                                      "default":"caro"
+                                  }}
+        }},
+
+        {"$limit": limit}
+    ]
+
+
+def cell_sums_facet(cell_size: float) -> list:
+    """
+    Sub-pipeline with the additive sums of every grid cell (same sums as the tile pyramid).
+    """
+    return [
+        {"$group": {
+            "_id": {
+                "x": {"$floor": {"$divide": [{"$add": ["$longitude", 180]}, cell_size]}},
+                "y": {"$floor": {"$divide": [{"$add": ["$latitude",   90]}, cell_size]}},
+            },
+            **CELL_SUMS,
+        }}
+    ]
+
+
+def cell_columns_facet(cell_size: float, limit: int) -> list:
+    """
+    Per-cell sums pushed into one document of arrays, for the columnar formats.
+    """
+    return cell_sums_facet(cell_size) + [
+        {"$limit": limit},
+        {"$group": {"_id": None, **{k: {"$push": f"${k}"} for k in CELL_SUMS}}},
+    ]
+
+
+def build_overall_stats(stats_doc: Optional[dict], dataset_total: int) -> dict:
+    """
+    Turn the raw sums of the stats facet into the overall_stats block.
+    """
+    overall_stats = {
+        "total_restaurants":     0,
+        "pct_total_restaurants": 0.0,
+        "vegan_count":           0,
+        "pct_vegan":             0.0,
+        "premium_count":         0,
+        "pct_premium":           0.0,
+        "avg_rating":            0.0,
+        "pct_avg_rating":        0.0,
+        "gluten_free_count":     0,
+        "pct_gluten_free":       0.0,
+        "avg_price_category":    "sin datos",
+        "avg_price_numeric":     0.0
+    }
+    if stats_doc and stats_doc.get("total", 0) > 0:
+        d = stats_doc
+        total   = d["total"]
+        vegan   = d["vegan_count"]
+        gluten  = d["gluten_free_count"]
+        premium = d["premium_count"]
+        avg_rt  = d["rating_sum"] / d["rating_count"] if d["rating_count"] > 0 else 0.0
+        price_avg_num = d["price_sum"] / d["price_count"] if d["price_count"] > 0 else 0.0
+        price_cat     = (
+            "barato"  if price_avg_num < 1.5 else
+            "regular" if price_avg_num < 2.5 else
+            "caro"
+        )
+
+        overall_stats.update({
+            "total_restaurants":     total,
+            "pct_total_restaurants": round(total / dataset_total * 100, 2) if dataset_total > 0 else 0.0,
+            "vegan_count":           vegan,
+            "pct_vegan":             round(vegan / total * 100, 2),
+            "premium_count":         premium,
+            "pct_premium":           round(premium / total * 100, 2),
+            "avg_rating":            round(avg_rt, 2),
+            "pct_avg_rating":        round(avg_rt / 5 * 100, 2),
+            "gluten_free_count":     gluten,
+            "pct_gluten_free":       round(gluten / total * 100, 2),
+            "avg_price_category":    price_cat,
+            "avg_price_numeric":     round(price_avg_num, 2)
+        })
+    return overall_stats
+
+
+def encode_cursor(last_id: ObjectId, page: int) -> str:
+    """
+    Opaque continuation token: last _id of the page plus the next page number.
+    """
+    raw = json.dumps({"after": str(last_id), "page": page}).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(token: str) -> tuple:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token.encode()))
+        return ObjectId(data["after"]), int(data["page"])
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {token!r}") from e
+
+
+async def mongo_facets(match_stage: dict, north: float, south: float, east: float,
+                       west: float, zoom: float, limit: Optional[int], approx: bool = False,
+                       columnar: bool = False) -> tuple:
+    """
+    One $facet aggregation plus the cached dataset total, run concurrently.
+    Clusters come from the tile pyramid when the filters match a precomputed key.
+    With approx, stats and distributions are estimated from the stratified
+    sample instead; clusters stay exact. With columnar, clusters are
+    returned as struct-of-arrays (cluster_columns).
+    """
+    facets = {} if approx else {
+        "stats":         stats_facet(),
+        "meals_list":    distribution_facet("meals_list", "meal"),
+        "top_tags_list": distribution_facet("top_tags_list", "tag"),
+    }
+    # integer zooms with a precomputed filter key read the tile pyramid
+    key = tile_key(match_stage) if zoom <= 15 and zoom == int(zoom) else None
+    if key is not None and await tiles_ready():
+        clusters_task = read_cluster_tiles(key, int(zoom), north, south, east, west, limit or 500, columnar)
+    else:
+        clusters_task = None
+        if zoom <= 15 and columnar:
+            facets["clusters"] = cell_columns_facet(cluster_cell_size(zoom), limit or 500)
+        elif zoom <= 15:
+            facets["clusters"] = cluster_facet(cluster_cell_size(zoom), limit or 500)
+
+    facet_res, dataset_total, tile_clusters, sample_res = await asyncio.gather(
+        timed("aggregate", analytics_collection.aggregate(
+            [{"$match": match_stage}, {"$facet": facets}], **aggregate_options()
+        ).to_list(length=1)) if facets else asyncio.sleep(0, []),
+        timed("count", restaurant_count()),
+        timed("tiles", clusters_task) if clusters_task else asyncio.sleep(0),
+        timed("sample", sample_facets(match_stage)) if approx else asyncio.sleep(0),
+    )
+    res = facet_res[0] if facet_res else {}
+    if clusters_task:
+        res["clusters"] = tile_clusters
+    elif columnar and "clusters" in res:
+        res["clusters"] = cluster_columns(res["clusters"][0] if res["clusters"] else {})
+    if approx:
+        res.update(sample_res)
+    return res, dataset_total
+
+
+def canonical_filters(filters: FilterParams) -> dict:
+    """
+    Validated filter stage with sorted $in lists, for keys and comparisons.
+    """
+    return {
+        fld: {op: sorted(v, key=str) if isinstance(v, list) else v for op, v in cond.items()}
+        if isinstance(cond, dict) else cond
+        for fld, cond in build_filter_stage(filters).items()
+    }
+
+
+async def delta_mongo_facets(filters: FilterParams, north: float, south: float, east: float,
+                             west: float, zoom: float, limit: Optional[int],
+                             delta_token: Optional[str], columnar: bool = False) -> tuple:
+    """
+    Additive facets (stats, distributions, per-cell sums) of the viewport:
+    the previous state of delta_token plus the strips that entered minus
+    the strips that left, or one full pass when no usable state exists.
+    Returns (result shaped like mongo_facets, dataset total, new token).
+    """
+    generation = delta_states.generation
+    filter_stage = build_filter_stage(filters)
+    filter_key = json.dumps(canonical_filters(filters), sort_keys=True)
+    bbox = (north, south, east, west)
+    facets = {
+        "stats":         stats_facet(),
+        "meals_list":    distribution_facet("meals_list", "meal"),
+        "top_tags_list": distribution_facet("top_tags_list", "tag"),
+        "cells":         cell_sums_facet(cluster_cell_size(zoom)),
+    }
+
+    async def run(match: Optional[dict]) -> dict:
+        if match is None:
+            return {}
+        res = await analytics_collection.aggregate(
+            [{"$match": match}, {"$facet": facets}], **aggregate_options()
+        ).to_list(length=1)
+        # the delta state keeps labels: codes are decoded before it is updated
+        return await decode_distributions(res[0]) if res else {}
+
+    state = load_state(delta_token) if delta_token else None
+    plan = plan_delta(state, filter_key, bbox, zoom)
+    if plan is None:
+        full, dataset_total = await asyncio.gather(
+            timed("aggregate", run(build_match_stage(filters, north, south, east, west))),
+            timed("count", restaurant_count()),
+        )
+        state = new_state(filter_key, bbox, zoom)
+        apply_facets(state, full)
+    else:
+        entering, leaving = plan
+        added, removed, dataset_total = await asyncio.gather(
+            timed("delta_entering", run(strips_match(filter_stage, entering))),
+            timed("delta_leaving", run(strips_match(filter_stage, leaving))),
+            timed("count", restaurant_count()),
+        )
+        state["bbox"] = list(bbox)
+        apply_facets(state, added, 1)
+        apply_facets(state, removed, -1)
+    return finalize(state, limit or 500, columnar), dataset_total, save_state(state, generation)
+
+
+async def compute_analytics(
+    filters: FilterParams,
+    north: float,
+    south: float,
+    east: float,
+    west: float,
+    zoom: float,
+    page: int = 1,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    delta: bool = False,
+    delta_token: Optional[str] = None,
+    approx: bool = False,
+    columnar: bool = False,
+) -> dict:
+    """
+    Single-pass analytics: stats, meal/tag distributions and clusters come
+    from one $facet aggregation (mongo_facets) or, when selected, from the
+    in-memory columnar engine. The listing branch (zoom > 15) needs one extra find
+    because its page depends on the matched total; it pages with skip() for
+    `page` or by _id keyset when a `cursor` token is given.
+    With `delta` (cluster zooms, MongoDB path) the facets are additive and
+    the payload carries a delta_token for the next, slightly panned viewport.
+    With `approx` (zoom <= APPROX_MAX_ZOOM, sample built) stats and
+    distributions are estimated from a stratified sample, with error bounds.
+    With `columnar`, clusters and restaurants are struct-of-arrays (one list
+    per field) built straight from the cell sums and the listing documents.
+    Meal, tag and cuisine filters and distributions work on dictionary codes;
+    labels are restored before building the payload.
+    """
+    await load_vocabulary()
+    await refresh_filter_codes(filters)
+    match_stage = build_match_stage(filters, north, south, east, west)
+    engine = active_engine()
+    mask = None
+    token = None
+    approx = approx and engine is None and zoom <= APPROX_MAX_ZOOM and await sample_ready()
+
+    if approx:
+        res, dataset_total = await mongo_facets(
+            match_stage, north, south, east, west, zoom, limit, approx=True, columnar=columnar
+        )
+    elif delta and engine is None and zoom <= 15:
+        res, dataset_total, token = await delta_mongo_facets(
+            filters, north, south, east, west, zoom, limit, delta_token, columnar
+        )
+    elif engine is not None:
+        # columnar engine: same facet results from in-memory arrays
+        with span("columnar"):
+            res, mask = await run_cpu(
+                engine.facets, build_filter_stage(filters), north, south, east, west, zoom, limit or 500, columnar
+            )
+        with span("count"):
+            dataset_total = await restaurant_count()
+    else:
+        # in-process grid index: small viewports become an _id lookup
+        with span("spatial"):
+            ids = await run_cpu(candidate_ids, north, south, east, west)
+        if ids is not None:
+            match_stage = {**build_filter_stage(filters), "_id": {"$in": ids}}
+        res, dataset_total = await mongo_facets(
+            match_stage, north, south, east, west, zoom, limit, columnar=columnar
+        )
+    if token is None:
+        await decode_distributions(res)
+    stats_doc = res.get("stats") or [None]
+
+    payload = {
+        # the (snapped) area the numbers describe
+        "bbox":          {"north": north, "south": south, "east": east, "west": west},
+        "overall_stats": build_overall_stats(stats_doc[0], dataset_total),
+        "meals_list":    res.get("meals_list", []),
+        "top_tags_list": res.get("top_tags_list", []),
+    }
+
+    if approx:
+        payload["approx"] = res["approx"]
+
+    if zoom <= 15:
+        payload["clusters"] = res.get("clusters", cluster_columns({}) if columnar else [])
+        if token is not None:
+            payload["delta_token"] = token
+        return payload
+
+    # paginated listing; the stats facet already counted the matches
+    total_count = payload["overall_stats"]["total_restaurants"]
+    eff_limit   = limit or min(total_count, 100)
+    total_pages = math.ceil(total_count / eff_limit) if eff_limit > 0 else 1
+
+    # keyset on _id: a continuation token avoids skip() on deep pages
+    if cursor:
+        last_id, page = decode_cursor(cursor)
+        # merged with the grid index's _id $in, if any, instead of replacing it
+        query = {**match_stage, "_id": {**match_stage.get("_id", {}), "$gt": last_id}}
+        skip  = 0
+    else:
+        last_id = None
+        page  = min(page, total_pages) if total_pages else 1
+        query = match_stage
+        skip  = (page - 1) * eff_limit
+
+    if engine is not None:
+        # the engine resolves the page; Mongo only fetches those documents
+        ids = await run_cpu(engine.listing_ids, mask, last_id.binary if last_id else None, skip, eff_limit)
+        query = {"_id": {"$in": [ObjectId(b) for b in ids]}}
+        skip  = 0
+
+    docs_cursor = (
+        collection
+        .find(query, LISTING_PROJECTION)
+        .sort("_id", 1)
+        .skip(skip)
+        .limit(eff_limit)
+    )
+
+    with span("find"):
+        restaurants = await docs_cursor.to_list(length=eff_limit)
+    for doc in restaurants:
+        for coord in ("latitude","longitude"):
+            v = doc.get(coord)
+            if isinstance(v, float) and (math.isnan(v) or math.isinf(v)):
+                doc[coord] = None
+    for field in ("meals_list", "top_tags_list"):
+        await refresh_for_codes(field, (code for doc in restaurants for code in doc.get(field) or ()))
+        decode_lists(field, restaurants)
+
+    next_cursor = None
+    if restaurants and len(restaurants) == eff_limit and page < total_pages:
+        next_cursor = encode_cursor(restaurants[-1]["_id"], page + 1)
+    for doc in restaurants:
+        doc.pop("_id", None)
+
+    if columnar:
+        fields = [f for f in LISTING_PROJECTION if f != "_id"]
+        payload["restaurants"] = listing_columns(restaurants, fields)
+    else:
+        payload["restaurants"] = restaurants
+    payload["pagination"] = {
+        "page":          page,
+        "limit":         eff_limit,
+        "total_pages":   total_pages,
+        "total_results": total_count,
+        "next_cursor":   next_cursor
+    }
+    return payload
+
+
+# snapping grid in screen pixels: the answer covers at most a few pixels more than the viewport
+SNAP_PX = 4
+
+
+def snap_bbox(north: float, south: float, east: float, west: float, zoom: float) -> tuple:
+    """
+    Expand the bbox outwards to a grid of SNAP_PX pixels at the zoom, so
+    viewports shifted by less than that share one cache entry (and one computation).
+    """
+    cell = SNAP_PX * 360.0 / (256 * (2 ** zoom))
+    return (
+        round(min(90.0,   math.ceil((north + 90) / cell) * cell - 90), 9),
+        round(max(-90.0,  math.floor((south + 90) / cell) * cell - 90), 9),
+        round(min(180.0,  math.ceil((east + 180) / cell) * cell - 180), 9),
+        round(max(-180.0, math.floor((west + 180) / cell) * cell - 180), 9),
+    )
+
+
+def analytics_cache_key(filters: FilterParams, bbox: tuple, zoom: float,
+                        page: int, limit: Optional[int], cursor: Optional[str] = None,
+                        delta: bool = False, approx: bool = False, media_type: str = JSON) -> str:
+    """
+    Canonical key: validated filters with sorted lists, snapped bbox, zoom, paging, modes and format.
+    """
+    return json.dumps(
+        [canonical_filters(filters), bbox, zoom, page, limit, cursor, delta, approx, media_type], sort_keys=True
+    )
+
+
 @router.post("/analytics")
 async def get_analytics(
+    request:   Request,
     filters:   FilterParams,
     north:     float = Query(..., ge=-90, le=90),
     south:     float = Query(..., ge=-90, le=90),
@@ -49,282 +619,44 @@ async def get_analytics(
     zoom:      float = Query(..., ge=0, le=22),
     page:      int   = Query(1, ge=1),
     limit:    Optional[int] = Query(None, ge=1, le=1000),
+    cursor:   Optional[str] = Query(None, description="next_cursor of the previous listing page"),
+    delta:    bool = Query(False, description="Additive mode; the response carries a delta_token"),
+    delta_token: Optional[str] = Query(None, description="delta_token of the previous viewport"),
+    approx:   bool = Query(False, description="Sampled stats with error bounds at zoom <= 6"),
 ):
     try:
-        # 1) Build match_stage from filters
-        match_stage: dict = {}
-        if is_valid_filter_value(filters.country):
-            match_stage["country"] = (
-                {"$in": filters.country}
-                if isinstance(filters.country, list)
-                else filters.country
-            )
-        for fld in ("city", "province", "claimed", "price_level_cat"):
-            v = getattr(filters, fld)
-            if is_valid_filter_value(v):
-                match_stage[fld] = v
-        for fld in ("service", "food"):
-            v = getattr(filters, fld)
-            if v is not None and v > 0:
-                match_stage[fld] = {"$gte": v}
-        for filt, dbf in (
-            ("meal_list", "meals_list"),
-            ("cuisines_list", "cuisines_list"),
-            ("top_tags_list", "top_tags_list"),
-        ):
-            vals = getattr(filters, filt)
-            if is_valid_filter_value(vals):
-                match_stage[dbf] = {"$in": vals}
-
-        # 2) Apply bounding box
-        match_stage["latitude"]  = {"$gte": south, "$lte": north}
-        match_stage["longitude"] = {"$gte": west,  "$lte": east}
-
-        # 3) Compute overall stats with percentages
-        stats_pipeline = [
-            {"$match": match_stage},
-            {"$addFields": {
-                "vegan":          {"$eq":[{"$toLower":{"$toString":"$vegan_options"}}, "si"]},
-                "gluten":         {"$eq":[{"$toLower":{"$toString":"$gluten_free"}},   "si"]},
-                "valid_rating":   {"$cond":[
-                                      {"$and":[
-                                          {"$ne":["$avg_rating", None]},
-                                          {"$isNumber":"$avg_rating"},
-                                          {"$gt":["$avg_rating",   0]},
-                                          {"$lte":["$avg_rating",   5]}
-                                      ]},
-                                      "$avg_rating",
-                                      None
-                                  ]},
-                "price_numeric":  {"$switch":{
-                                      "branches":[
-                                          {"case":{"$eq":[{"$toLower":{"$toString":"$price_level_cat"}}, "barato"]},  "then":1},
-                                          {"case":{"$eq":[{"$toLower":{"$toString":"$price_level_cat"}}, "regular"]}, "then":2},
-                                          {"case":{"$eq":[{"$toLower":{"$toString":"$price_level_cat"}}, "caro"]},    "then":3}
-                                      ],
-                                      "default": None
-                                  }}
-            }},
-            {"$group": {
-                "_id": None,
-                "total":             {"$sum": 1},
-                "vegan_count":       {"$sum":{"$cond":["$vegan", 1, 0]}},
-                "gluten_free_count": {"$sum":{"$cond":["$gluten",1,0]}},
-                "rating_sum":        {"$sum":{"$ifNull":["$valid_rating",0]}},
-                "rating_count":      {"$sum":{"$cond":[{"$ne":["$valid_rating",None]},1,0]}},
-                "premium_count":     {"$sum":{"$cond":[{"$eq":["$price_numeric",3]},1,0]}},
-                "price_sum":         {"$sum":{"$ifNull":["$price_numeric",0]}},
-                "price_count":       {"$sum":{"$cond":[{"$ne":["$price_numeric",None]},1,0]}}
-            }}
-        ]
-        stats_res = await collection.aggregate(stats_pipeline).to_list(length=1)
-
-        overall_stats = {
-            "total_restaurants":     0,
-            "pct_total_restaurants": 0.0,
-            "vegan_count":           0,
-            "pct_vegan":             0.0,
-            "premium_count":         0,
-            "pct_premium":           0.0,
-            "avg_rating":            0.0,
-            "pct_avg_rating":        0.0,
-            "gluten_free_count":     0,
-            "pct_gluten_free":       0.0,
-            "avg_price_category":    "sin datos",
-            "avg_price_numeric":     0.0
-        }
-        if stats_res and stats_res[0].get("total", 0) > 0:
-            d = stats_res[0]
-            total   = d["total"]
-            vegan   = d["vegan_count"]
-            gluten  = d["gluten_free_count"]
-            premium = d["premium_count"]
-            avg_rt  = d["rating_sum"] / d["rating_count"] if d["rating_count"] > 0 else 0.0
-            price_avg_num = d["price_sum"] / d["price_count"] if d["price_count"] > 0 else 0.0
-            price_cat     = (
-                "barato"  if price_avg_num < 1.5 else
-                "regular" if price_avg_num < 2.5 else
-                "caro"
+        bbox = snap_bbox(north, south, east, west, zoom)
+        delta = delta or delta_token is not None
+        # the cache key holds the dictionary codes of the list filters
+        await load_vocabulary()
+        await refresh_filter_codes(filters)
+        # formato compacto (columnar JSON / MessagePack) según la cabecera Accept
+        media_type = negotiate(request.headers.get("accept"))
+        key = analytics_cache_key(filters, bbox, zoom, page, limit, cursor, delta, approx, media_type)
+        body = analytics_cache.get(key)
+        if body is not None:
+            return Response(content=body, media_type=media_type, headers={"X-Cache": "HIT", "Vary": "Accept"})
+
+        async def compute() -> bytes:
+            generation = analytics_cache.generation
+            payload = await compute_analytics(
+                filters, *bbox, zoom, page, limit, cursor, delta, delta_token, approx, is_columnar(media_type)
             )
+            with span("serialize"):
+                body = await run_cpu(encode, payload, media_type)
+            analytics_cache.set(key, body, generation)
+            return body
 
-            # Total dataset for pct_total_restaurants
-            dataset_total = await collection.count_documents({})
-
-            overall_stats.update({
-                "total_restaurants":     total,
-                "pct_total_restaurants": round(total / dataset_total * 100, 2) if dataset_total > 0 else 0.0,
-                "vegan_count":           vegan,
-                "pct_vegan":             round(vegan / total * 100, 2),
-                "premium_count":         premium,
-                "pct_premium":           round(premium / total * 100, 2),
-                "avg_rating":            round(avg_rt, 2),
-                "pct_avg_rating":        round(avg_rt / 5 * 100, 2),
-                "gluten_free_count":     gluten,
-                "pct_gluten_free":       round(gluten / total * 100, 2),
-                "avg_price_category":    price_cat,
-                "avg_price_numeric":     round(price_avg_num, 2)
-            })
-
-        # 4) Meals list distribution
-        meals_pipeline = [
-            {"$match": match_stage},
-            {"$unwind": "$meals_list"},
-            {"$group": {"_id":"$meals_list","count":{"$sum":1}}},
-            {"$project":{"_id":0,"meal":"$_id","count":1}}
-        ]
-        meals_dist = await collection.aggregate(meals_pipeline).to_list()
-
-        # 5) Top tags list distribution
-        tags_pipeline = [
-            {"$match": match_stage},
-            {"$unwind": "$top_tags_list"},
-            {"$group": {"_id":"$top_tags_list","count":{"$sum":1}}},
-            {"$project":{"_id":0,"tag":"$_id","count":1}}
-        ]
-        tags_dist = await collection.aggregate(tags_pipeline).to_list()
-
-
-        # 6) Clusters vs. listing
-        if zoom <= 15:
-            # clustering
-            if zoom <= 6:
-                max_px = 190
-            elif zoom <= 12:
-                max_px = 120
-            else:
-                max_px = 80
-            deg_px    = 360.0 / (256 * (2 ** zoom))
-            cell_size = max_px * deg_px
-
-            cluster_pipeline = [
-                {"$match": match_stage},
-
-                # recalculate derived fields per document
-                {"$addFields": {
-                    "vegan":         {"$eq":[{"$toLower":{"$toString":"$vegan_options"}}, "si"]},
-                    "gluten":        {"$eq":[{"$toLower":{"$toString":"$gluten_free"}},   "si"]},
-                    "valid_rating":  {"$cond":[
-                                         {"$and":[
-                                             {"$ne":["$avg_rating", None]},
-                                             {"$isNumber":"$avg_rating"},
-                                             {"$gt":["$avg_rating",   0]},
-                                             {"$lte":["$avg_rating",   5]}
-                                         ]},
-                                         "$avg_rating",
-                                         None
-                                     ]},
-                    "price_numeric": {"$switch":{
-                                         "branches":[
-                                             {"case":{"$eq":[{"$toLower":{"$toString":"$price_level_cat"}}, "barato"]},  "then":1},
-                                             {"case":{"$eq":[{"$toLower":{"$toString":"$price_level_cat"}}, "regular"]}, "then":2},
-                                             {"case":{"$eq":[{"$toLower":{"$toString":"$price_level_cat"}}, "caro"]},    "then":3}
-                                         ],
-                                         "default": None
-                                     }}
-                }},
-
-                # compute grid cell
-                {"$addFields": {
-                    "cellX": {"$floor": {"$divide":[{"$add":["$longitude",180]}, cell_size]}},
-                    "cellY": {"$floor": {"$divide":[{"$add":["$latitude",  90]}, cell_size]}}
-                }},
-
-                # group per cell
-                {"$group": {
-                    "_id":               {"x":"$cellX","y":"$cellY"},
-                    "total_restaurants": {"$sum":1},
-                    "latitude":          {"$avg":"$latitude"},
-                    "longitude":         {"$avg":"$longitude"},
-                    "vegan_count":       {"$sum":{"$cond":["$vegan",1,0]}},
-                    "gluten_free_count": {"$sum":{"$cond":["$gluten",1,0]}},
-                    "avgRatingCluster":  {"$avg":"$valid_rating"},
-                    "avgPriceCluster":   {"$avg":"$price_numeric"},
-                    "premium_count":     {"$sum":{"$cond":[{"$eq":["$price_numeric",3]},1,0]}}
-                }},
-
-                # final shape with percentages
-                {"$project": {
-                    "_id":                0,
-                    "total_restaurants":  1,
-                    "latitude":           {"$round":["$latitude",6]},
-                    "longitude":          {"$round":["$longitude",6]},
-                    "vegan_count":        1,
-                    "pct_vegan":          {"$round":[{"$multiply":[{"$divide":["$vegan_count","$total_restaurants"]},100]},2]},
-                    "gluten_free_count":  1,
-                    "pct_gluten_free":    {"$round":[{"$multiply":[{"$divide":["$gluten_free_count","$total_restaurants"]},100]},2]},
-                    "avg_rating":         {"$round":["$avgRatingCluster",2]},
-                    "pct_avg_rating":     {"$round":[{"$multiply":[{"$divide":["$avgRatingCluster",5]},100]},2]},
-                    "premium_count":      1,
-                    "pct_premium":        {"$round":[{"$multiply":[{"$divide":["$premium_count","$total_restaurants"]},100]},2]},
-                    "avg_price_category": {"$switch":{
-                                              "branches":[
-                                                  {"case":{"$lt":["$avgPriceCluster",1.5]},"then":"barato"},
-                                                  {"case":{"$lt":["$avgPriceCluster",2.5]},"then":"regular"}
-                                              ],
-                                              "default":"caro"
-                                          }}
-                }},
-
-                {"$limit": limit or 500}
-            ]
-            clusters = await collection.aggregate(cluster_pipeline).to_list(length=limit or 500)
-
-            payload = {
-                "overall_stats":   overall_stats,
-                "meals_list":      meals_dist,
-                "top_tags_list":   tags_dist,
-                "clusters":        clusters
-            }
-        else:
-            # paginated listing
-            total_count = await collection.count_documents(match_stage)
-            eff_limit   = limit or min(total_count, 100)
-            total_pages = math.ceil(total_count / eff_limit) if eff_limit > 0 else 1
-            page        = min(page, total_pages) if total_pages else 1
-            skip        = (page - 1) * eff_limit
-
-            cursor = (
-                collection
-                .find(match_stage, {
-                    "_id": 0,
-                    "name": 1,
-                    "city": 1,
-                    "country": 1,
-                    "latitude": 1,
-                    "longitude": 1,
-                    "avg_rating": 1,
-                    "price_level_cat": 1,
-                    "claimed": 1,
-                    "vegan_options": 1,
-                    "gluten_free": 1,
-                    "meals_list": 1,
-                    "top_tags_list": 1
-                })
-                .skip(skip)
-                .limit(eff_limit)
-            )
+        # peticiones idénticas simultáneas esperan un único cálculo
+        body, shared = await analytics_flight.do(key, compute)
+        return Response(content=body, media_type=media_type,
+                        headers={"X-Cache": "COALESCED" if shared else "MISS", "Vary": "Accept"})
 
-            restaurants = await cursor.to_list(length=eff_limit)
-            for doc in restaurants:
-                for coord in ("latitude","longitude"):
-                    v = doc.get(coord)
-                    if isinstance(v, float) and (math.isnan(v) or math.isinf(v)):
-                        doc[coord] = None
-
-            payload = {
-                "overall_stats":   overall_stats,
-                "meals_list":      meals_dist,
-                "top_tags_list":   tags_dist,
-                "restaurants":     restaurants,
-                "pagination": {
-                    "page":          page,
-                    "limit":         eff_limit,
-                    "total_pages":   total_pages,
-                    "total_results": total_count
-                }
-            }
-
-        return JSONResponse(content=sanitize(payload))
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+    except ExecutionTimeout:
+        return JSONResponse(status_code=504, content={"error": "Analytics query exceeded maxTimeMS"})
 
     except Exception as e:
         return JSONResponse(
@@ -336,56 +668,63 @@ async def get_analytics(
 
 
 
+@router.get("/analytics/cache")
+async def analytics_cache_stats():
+    return {
+        **analytics_cache.stats(),
+        "coalescing":         analytics_flight.stats(),
+        "summary_coalescing": summary_flight.stats(),
+    }
+
+
 @router.get("/restaurants_count")
-async def restaurants_count():
-    count = await db["restaurants"].count_documents({})
+async def restaurants_count(exact: bool = Query(False, description="Forzar un recuento exacto")):
+    count = await restaurant_count(exact=exact)
     return {"count": count}
 
 
+async def summary_response(tipo: str) -> Response:
+    """
+    Precomputed summary items; version and rebuild time travel as headers.
+    """
+    async def render() -> tuple:
+        doc = await get_summary(tipo)
+        return dumps(doc["items"]), {
+            "X-Summary-Version": str(doc["version"]),
+            "Last-Modified":     format_datetime(doc["built_at"].replace(tzinfo=timezone.utc), usegmt=True),
+        }
+
+    (body, headers), _ = await summary_flight.do(tipo, render)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
 @router.get("/restaurants_by_country")
 async def restaurants_by_country():
-    pipeline = [
-        {"$group": {"_id": "$country", "count": {"$sum": 1}}},
-        {"$sort": {"count": -1}}
-    ]
-    result = await db["restaurants"].aggregate(pipeline).to_list(length=None)
-    return result
+    return await summary_response("restaurants_by_country")
 
 
 @router.get("/top_tags_by_country")
 async def top_tags_by_country():
-    pipeline = [
-        {"$unwind": "$top_tags_list"},
-        {"$group": {"_id": {"country": "$country", "tag": "$top_tags_list"}, "count": {"$sum": 1}}},
-        {"$sort": {"count": -1}},
-        {"$group": {"_id": "$_id.country", "top_tags": {"$push": {"tag": "$_id.tag", "count": "$count"}}}},
-        {"$project": {"top_tags": {"$slice": ["$top_tags", 5]}}}
-    ]
-    result = await db["restaurants"].aggregate(pipeline).to_list(length=None)
-    return result
+    return await summary_response("top_tags_by_country")
 
 @router.get("/top_cuisines_by_country")
 async def top_cuisines_by_country():
-    pipeline = [
-        {"$unwind": "$cuisines_list"},
-        {"$group": {"_id": {"country": "$country", "cuisine": "$cuisines_list"}, "count": {"$sum": 1}}},
-        {"$sort": {"count": -1}},
-        {"$group": {"_id": "$_id.country", "top_cuisines": {"$push": {"cuisine": "$_id.cuisine", "count": "$count"}}}},
-        {"$project": {"top_cuisines": {"$slice": ["$top_cuisines", 5]}}}
-    ]
-    result = await db["restaurants"].aggregate(pipeline).to_list(length=None)
-    return result
+    return await summary_response("top_cuisines_by_country")
 
 @router.get("/avg_rating_by_cuisine")
 async def avg_rating_by_cuisine():
-    pipeline = [
-        {"$match": {"avg_rating": {"$ne": 0}}},  # excluye los nulos
-        {"$unwind": "$cuisines_list"},
-        {"$group": {"_id": "$cuisines_list", "avg_rating": {"$avg": "$avg_rating"}}},
-        {"$sort": {"avg_rating": -1}}
-    ]
-    result = await db["restaurants"].aggregate(pipeline).to_list(length=None)
-    return result
+    return await summary_response("avg_rating_by_cuisine")
+
+@router.get("/summaries")
+async def summaries_status():
+    """
+    Version and last rebuild time of every summary, to detect stale data.
+    """
+    status = {}
+    for tipo in SUMMARY_PIPELINES:
+        doc = await get_summary(tipo)
+        status[tipo] = {"version": doc["version"], "built_at": doc["built_at"].isoformat()}
+    return status
 
 @router.get("/filters/countries")
 async def get_countries():
@@ -1,10 +1,36 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from endpoints import router
 from analytics_endpoints import router as analytics_router
 from fastapi.middleware.cors import CORSMiddleware
+from database import close, connect, ensure_indexes
+from columnar import reload_engine
+from spatial import reload_spatial_index
+from config import METRICS_ENABLED
+from metrics import metrics_middleware
+from executors import shutdown_executors
+from vocabulary import load_vocabulary
+from operations import migrate_derived_fields, migrate_list_fields
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await connect()
+    await ensure_indexes()
+    await load_vocabulary(force=True)
+    # campos derivados (location, vegan, valid_rating...) de documentos antiguos
+    await migrate_derived_fields()
+    # listas anteriores a la codificación por diccionario → códigos
+    await migrate_list_fields()
+    # solo carga datos si ANALYTICS_ENGINE=columnar / SPATIAL_INDEX=1
+    await reload_engine()
+    await reload_spatial_index()
+    yield
+    shutdown_executors()
+    close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -14,5 +40,8 @@ app.add_middleware(
     allow_headers=["*"],                # para que acepte Content-Type, Authorization, etc.
 )
 
+if METRICS_ENABLED:
+    app.middleware("http")(metrics_middleware)
+
 app.include_router(router)
 app.include_router(analytics_router)
@@ -0,0 +1,102 @@
+"""
+Latency benchmark for /analytics: single-pass $facet engine vs. the
+previous sequential pipelines (stats → meals → tags → clusters/listing).
+
+Run from the repository root against a populated local MongoDB:
+
+    python -m benchmarks.bench_analytics --runs 20
+"""
+import argparse
+import asyncio
+import math
+import statistics
+import time
+
+from analytics_endpoints import (
+    LISTING_PROJECTION,
+    build_match_stage,
+    build_overall_stats,
+    cluster_cell_size,
+    cluster_facet,
+    compute_analytics,
+    distribution_facet,
+    stats_facet,
+)
+from database import collection
+from models import FilterParams
+
+# (north, south, east, west, zoom)
+VIEWPORTS = [
+    (72.0, 34.0, 45.0, -25.0, 4),     # Europa completa
+    (49.0, 41.0, 10.0, -5.0, 6),      # Francia
+    (42.0, 40.5, 3.0, 1.0, 9),        # Barcelona y alrededores
+    (41.42, 41.36, 2.20, 2.12, 13),   # Barcelona centro
+    (41.395, 41.38, 2.18, 2.16, 16),  # listado paginado
+]
+
+
+async def sequential_analytics(filters, north, south, east, west, zoom, page=1, limit=None):
+    """
+    The pre-$facet implementation: one round trip per pipeline plus two counts.
+    """
+    match_stage = build_match_stage(filters, north, south, east, west)
+
+    stats_res = await collection.aggregate([{"$match": match_stage}] + stats_facet()).to_list(length=1)
+    dataset_total = 0
+    if stats_res and stats_res[0].get("total", 0) > 0:
+        dataset_total = await collection.count_documents({})
+    overall_stats = build_overall_stats(stats_res[0] if stats_res else None, dataset_total)
+
+    meals_dist = await collection.aggregate(
+        [{"$match": match_stage}] + distribution_facet("meals_list", "meal")
+    ).to_list(length=None)
+    tags_dist = await collection.aggregate(
+        [{"$match": match_stage}] + distribution_facet("top_tags_list", "tag")
+    ).to_list(length=None)
+
+    payload = {"overall_stats": overall_stats, "meals_list": meals_dist, "top_tags_list": tags_dist}
+    if zoom <= 15:
+        pipeline = [{"$match": match_stage}] + cluster_facet(cluster_cell_size(zoom), limit or 500)
+        payload["clusters"] = await collection.aggregate(pipeline).to_list(length=limit or 500)
+        return payload
+
+    total_count = await collection.count_documents(match_stage)
+    eff_limit   = limit or min(total_count, 100)
+    total_pages = math.ceil(total_count / eff_limit) if eff_limit > 0 else 1
+    page        = min(page, total_pages) if total_pages else 1
+    cursor = collection.find(match_stage, LISTING_PROJECTION).skip((page - 1) * eff_limit).limit(eff_limit)
+    payload["restaurants"] = await cursor.to_list(length=eff_limit)
+    return payload
+
+
+async def measure(fn, runs: int) -> list:
+    filters = FilterParams()
+    timings = []
+    for _ in range(runs):
+        for vp in VIEWPORTS:
+            t0 = time.perf_counter()
+            await fn(filters, *vp)
+            timings.append((time.perf_counter() - t0) * 1000)
+    return timings
+
+
+def summary(name: str, timings: list) -> str:
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    return f"{name:<12} p50={statistics.median(timings):8.2f} ms  p95={p95:8.2f} ms  n={len(timings)}"
+
+
+async def main(runs: int):
+    # calentamos caches de Mongo antes de medir
+    await measure(compute_analytics, 1)
+    seq = await measure(sequential_analytics, runs)
+    facet = await measure(compute_analytics, runs)
+    print(summary("sequential", seq))
+    print(summary("facet", facet))
+    print(f"speedup p50: {statistics.median(seq) / statistics.median(facet):.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=10)
+    asyncio.run(main(parser.parse_args().runs))
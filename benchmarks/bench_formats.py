@@ -0,0 +1,89 @@
+"""
+Response format benchmark: clusters and listing pages as the current list of
+JSON objects vs. struct-of-arrays JSON and MessagePack with typed arrays
+(formats.py), measuring build + serialization time and raw / gzip size.
+
+    python -m benchmarks.bench_formats --runs 50
+"""
+import argparse
+import gzip
+import random
+import time
+
+from analytics_endpoints import LISTING_PROJECTION
+from formats import COLUMNAR, JSON, MSGPACK, available_formats, encode, listing_columns
+from tiles import CELL_SUMS, cluster_columns, tile_to_cluster
+
+
+def cell_sums(rng: random.Random, cells: int) -> list:
+    out = []
+    for _ in range(cells):
+        total = rng.randint(1, 5000)
+        rated = rng.randint(0, total)
+        priced = rng.randint(0, total)
+        out.append({
+            "total":             total,
+            "lat_sum":           rng.uniform(35, 60) * total,
+            "lon_sum":           rng.uniform(-10, 30) * total,
+            "vegan_count":       rng.randint(0, total),
+            "gluten_free_count": rng.randint(0, total),
+            "rating_sum":        rng.uniform(3, 5) * rated,
+            "rating_count":      rated,
+            "premium_count":     rng.randint(0, priced),
+            "price_sum":         rng.uniform(1, 3) * priced,
+            "price_count":       priced,
+        })
+    return out
+
+
+def listing_docs(rng: random.Random, rows: int) -> list:
+    # documentos tal como los devuelve find() con LISTING_PROJECTION
+    return [
+        {
+            "name": f"Restaurant {i}", "city": rng.choice(["Barcelona", "Madrid", "Paris"]),
+            "country": rng.choice(["Spain", "France"]), "latitude": rng.uniform(41.3, 41.5),
+            "longitude": rng.uniform(2.0, 2.3), "avg_rating": rng.choice([None, 3.5, 4.0, 4.5]),
+            "price_level_cat": rng.choice(["barato", "regular", "caro"]), "claimed": "si",
+            "vegan_options": "no", "gluten_free": rng.choice(["si", "no"]),
+            "meals_list": ["Lunch", "Dinner"], "top_tags_list": ["Cheap Eats", "Mediterranean"],
+        }
+        for i in range(rows)
+    ]
+
+
+def build(media_type: str, cells: list, docs: list) -> tuple:
+    if media_type == JSON:
+        clusters = {"clusters": [tile_to_cluster(c) for c in cells]}
+        listing = {"restaurants": docs}
+    else:
+        clusters = {"clusters": cluster_columns({k: [c[k] for c in cells] for k in CELL_SUMS})}
+        listing = {"restaurants": listing_columns(docs, [f for f in LISTING_PROJECTION if f != "_id"])}
+    return encode(clusters, media_type), encode(listing, media_type)
+
+
+def main(runs: int, clusters: int, restaurants: int):
+    rng = random.Random(5)
+    cells, docs = cell_sums(rng, clusters), listing_docs(rng, restaurants)
+    base = None
+    for media_type in (JSON, COLUMNAR, MSGPACK):
+        if media_type not in available_formats():
+            print(f"{media_type:<40} not available (pip install msgpack)")
+            continue
+        t0 = time.perf_counter()
+        for _ in range(runs):
+            bodies = build(media_type, cells, docs)
+        ms = (time.perf_counter() - t0) / runs * 1000
+        sizes = [(len(b), len(gzip.compress(b))) for b in bodies]
+        base = base or (ms, sizes)
+        print(f"{media_type:<40} {ms:7.2f} ms ({base[0] / ms:4.1f}x)  "
+              f"clusters {sizes[0][0] / 1024:6.1f} KiB, gzip {sizes[0][1] / 1024:5.1f} KiB  "
+              f"listing {sizes[1][0] / 1024:6.1f} KiB, gzip {sizes[1][1] / 1024:5.1f} KiB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--restaurants", type=int, default=1000)
+    args = parser.parse_args()
+    main(args.runs, args.clusters, args.restaurants)
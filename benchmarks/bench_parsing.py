@@ -0,0 +1,126 @@
+"""
+Micro-benchmark of the ingest parsers: per-row .apply (reference
+implementations) vs. the batched split_list_column / parse_hours_column on a
+synthetic chunk. Outputs are asserted identical before timings are printed.
+
+    python -m benchmarks.bench_parsing --rows 200000 --distinct-hours 5000
+"""
+import argparse
+import random
+import time
+
+import pandas as pd
+
+from operations import LIST_COLUMNS, parse_hours_column, split_list_column
+
+DAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+SLOTS = ["12:00-15:30", "19:00-23:00", "08:00-22:00", "13:00-16:00", "20:00-00:00"]
+VALUES = ["Lunch", "Dinner", "Breakfast", "Brunch", "Drinks", "Cheap Eats", "Italian", "Pizza",
+          "Mediterranean", "Spanish", "Vegetarian Friendly", "Good for families"]
+
+
+def legacy_group_hours(hour_str):
+    """
+    group_hours before the batched parser, kept as the reference implementation.
+    """
+    if not isinstance(hour_str, str) or hour_str == "no_disponible":
+        return []
+    items = [h.strip() for h in hour_str.split(",")]
+    grouped = {}
+    current_day = None
+    for h in items:
+        if ":" in h:
+            parts = h.split(":", 1)
+            if parts[0].lower() in ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]:
+                current_day = parts[0].lower()
+                grouped[current_day] = parts[1]
+            elif current_day:
+                grouped[current_day] += ", " + h
+    return [{"day": d, "hours": grouped[d]} for d in grouped]
+
+
+def reference_split_list(value):
+    """
+    Per-row list parsing with the normalized semantics of split_list: labels
+    stripped, empty ones dropped, repeats kept once in first-seen order.
+    """
+    if not isinstance(value, str) or value == "no_disponible":
+        return []
+    labels = []
+    for label in value.split(","):
+        label = label.strip()
+        if label and label not in labels:
+            labels.append(label)
+    return labels
+
+
+def synthetic_list(rng: random.Random) -> str:
+    if rng.random() < 0.1:
+        return "no_disponible"
+    labels = rng.sample(VALUES, rng.randint(1, 4))
+    # como en el CSV real: separador ", ", alguna etiqueta repetida o vacía
+    if rng.random() < 0.2:
+        labels.append(rng.choice(labels))
+    if rng.random() < 0.05:
+        labels.insert(rng.randint(0, len(labels)), "")
+    return rng.choice([", ", ","]).join(labels)
+
+
+def synthetic_hours(rng: random.Random) -> str:
+    if rng.random() < 0.15:
+        return "no_disponible"
+    parts = []
+    for day in rng.sample(DAYS, rng.randint(3, 7)):
+        parts.append(f"{day}:{rng.choice(SLOTS)}")
+        if rng.random() < 0.4:
+            parts.append(rng.choice(SLOTS))
+    return ", ".join(parts)
+
+
+def synthetic_frame(rows: int, distinct_hours: int, seed: int = 7) -> pd.DataFrame:
+    rng = random.Random(seed)
+    # muchos restaurantes comparten horario: se sortea de un catálogo acotado
+    schedules = [synthetic_hours(rng) for _ in range(distinct_hours)]
+    data = {"original_open_hours": [rng.choice(schedules) for _ in range(rows)]}
+    for col in LIST_COLUMNS:
+        data[col] = [synthetic_list(rng) for _ in range(rows)]
+    return pd.DataFrame(data)
+
+
+def per_row(df: pd.DataFrame) -> pd.DataFrame:
+    for col in LIST_COLUMNS:
+        df[col] = df[col].apply(reference_split_list)
+    df["original_open_hours"] = df["original_open_hours"].apply(legacy_group_hours)
+    return df
+
+
+def batched(df: pd.DataFrame) -> pd.DataFrame:
+    for col in LIST_COLUMNS:
+        df[col] = split_list_column(df[col])
+    df["original_open_hours"] = parse_hours_column(df["original_open_hours"])
+    return df
+
+
+def timed(fn, df: pd.DataFrame):
+    t0 = time.perf_counter()
+    out = fn(df.copy())
+    return out, time.perf_counter() - t0
+
+
+def main(rows: int, distinct_hours: int):
+    df = synthetic_frame(rows, distinct_hours)
+    old, t_old = timed(per_row, df)
+    new, t_new = timed(batched, df)
+    assert old.to_dict(orient="records") == new.to_dict(orient="records"), "outputs differ"
+    print(f"rows={rows} distinct_hours={distinct_hours}")
+    print(f"per-row  {t_old:8.3f} s  {t_old / rows * 1e6:8.2f} us/row")
+    print(f"batched  {t_new:8.3f} s  {t_new / rows * 1e6:8.2f} us/row")
+    print(f"speedup  {t_old / t_new:.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--distinct-hours", type=int, default=5_000)
+    args = parser.parse_args()
+    main(args.rows, args.distinct_hours)
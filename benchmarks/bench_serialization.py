@@ -0,0 +1,95 @@
+"""
+Serialization benchmark: previous sanitize / clean_mongo_document copy plus
+stdlib json (what JSONResponse does) vs. utils.dumps on representative
+analytics and catalog payloads.
+
+    python -m benchmarks.bench_serialization --runs 50
+"""
+import argparse
+import copy
+import json
+import random
+import time
+
+from bson import ObjectId
+
+from utils import clean_mongo_document, dumps, sanitize
+
+
+def stdlib_json(content) -> bytes:
+    # equivalente a JSONResponse.render
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def analytics_payload(rng: random.Random, clusters: int = 500, restaurants: int = 1000) -> dict:
+    def maybe_nan(v):
+        return float("nan") if rng.random() < 0.02 else v
+
+    return {
+        "overall_stats": {"total_restaurants": 120000, "pct_vegan": 12.5, "avg_rating": 4.1},
+        "meals_list": [{"meal": m, "count": rng.randint(1, 9000)} for m in ("Lunch", "Dinner", "Breakfast", "Brunch")],
+        "top_tags_list": [{"tag": f"tag {i}", "count": rng.randint(1, 9000)} for i in range(60)],
+        "clusters": [
+            {
+                "total_restaurants": rng.randint(1, 500), "latitude": rng.uniform(35, 60),
+                "longitude": rng.uniform(-10, 30), "vegan_count": 3, "pct_vegan": 10.0,
+                "gluten_free_count": 2, "pct_gluten_free": 6.67, "avg_rating": maybe_nan(4.2),
+                "pct_avg_rating": 84.0, "premium_count": 1, "pct_premium": 3.33, "avg_price_category": "regular",
+            }
+            for _ in range(clusters)
+        ],
+        "restaurants": [
+            {
+                "city": "Barcelona", "country": "Spain", "latitude": maybe_nan(rng.uniform(41.3, 41.5)),
+                "longitude": rng.uniform(2.0, 2.3), "avg_rating": maybe_nan(4.5), "price_level_cat": "caro",
+                "claimed": "si", "vegan_options": "no", "gluten_free": "si",
+                "meals_list": ["Lunch", "Dinner"], "top_tags_list": ["Cheap Eats", "Mediterranean"],
+            }
+            for _ in range(restaurants)
+        ],
+    }
+
+
+def catalog_payload(rng: random.Random, countries: int = 40, provinces: int = 20, cities: int = 30) -> dict:
+    return {
+        "_id": ObjectId(),
+        "tipo": "locations",
+        "items": [
+            {
+                "nombre": f"country {c}",
+                "provincias": [
+                    {"nombre": float("nan") if rng.random() < 0.05 else f"province {p}",
+                     "ciudades": [f"city {c}-{p}-{i}" for i in range(cities)]}
+                    for p in range(provinces)
+                ],
+            }
+            for c in range(countries)
+        ],
+    }
+
+
+def timed(fn, payloads: list) -> float:
+    t0 = time.perf_counter()
+    for payload in payloads:
+        fn(payload)
+    return (time.perf_counter() - t0) / len(payloads) * 1000
+
+
+def main(runs: int):
+    rng = random.Random(3)
+    cases = {
+        "analytics": (analytics_payload(rng), lambda p: stdlib_json(sanitize(p))),
+        "catalog":   (catalog_payload(rng), lambda p: stdlib_json(clean_mongo_document(p))),
+    }
+    for name, (payload, legacy) in cases.items():
+        # clean_mongo_document modifica el documento: una copia por run, fuera del tiempo medido
+        t_old = timed(legacy, [copy.deepcopy(payload) for _ in range(runs)])
+        t_new = timed(dumps, [payload] * runs)
+        print(f"{name:<10} legacy {t_old:8.2f} ms  dumps {t_new:8.2f} ms  "
+              f"size {len(dumps(payload)) / 1024:8.1f} KiB  speedup {t_old / t_new:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=20)
+    main(parser.parse_args().runs)
@@ -0,0 +1,50 @@
+"""
+Explain-plan check: every /analytics query shape must be answered through an
+index, never a COLLSCAN. Exits with status 1 when a collection scan is found.
+
+    python -m benchmarks.explain_plans
+"""
+import asyncio
+import sys
+
+from analytics_endpoints import build_match_stage, stats_facet
+from database import ensure_indexes, explain_aggregate, explain_find
+from models import FilterParams
+from vocabulary import load_vocabulary
+
+BBOX = (49.0, 41.0, 10.0, -5.0)  # north, south, east, west
+
+# one entry per FilterParams combination backed by an index
+CASES = {
+    "bbox":            FilterParams(),
+    "country":         FilterParams(country="France"),
+    "country_list":    FilterParams(country=["France", "Spain"]),
+    "province":        FilterParams(province="Catalonia"),
+    "city":            FilterParams(city="Paris"),
+    "price_level_cat": FilterParams(price_level_cat="caro"),
+    "meals":           FilterParams(meal_list=["Lunch", "Dinner"]),
+    "cuisines":        FilterParams(cuisines_list=["French"]),
+    "tags":            FilterParams(top_tags_list=["Cheap Eats"]),
+    "bbox_food":       FilterParams(food=4.0, service=4.0),
+}
+
+
+async def main() -> int:
+    await ensure_indexes()
+    # los filtros de listas se traducen a códigos del diccionario
+    await load_vocabulary(force=True)
+    failures = 0
+    for name, filters in CASES.items():
+        match_stage = build_match_stage(filters, *BBOX)
+        for kind, stages in (
+            ("facet",   await explain_aggregate([{"$match": match_stage}, {"$facet": {"stats": stats_facet()}}])),
+            ("listing", await explain_find(match_stage)),
+        ):
+            ok = "COLLSCAN" not in stages
+            failures += not ok
+            print(f"{'OK ' if ok else 'FAIL'} {name:<16} {kind:<8} {sorted(stages)}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
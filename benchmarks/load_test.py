@@ -0,0 +1,298 @@
+"""
+Load test for the dashboard API: optional synthetic ingest through
+insert_data_from_csv, then concurrent users replaying pan/zoom traces over
+/analytics plus the catalog and summary endpoints. Reports p50/p95/p99
+latency, throughput and peak RSS, and saves the run as JSON for comparison.
+
+Run from the repository root against a local MongoDB (in-process ASGI app):
+
+    python -m benchmarks.load_test --rows 1000000 --ingest --drop --users 16 --duration 60
+    python -m benchmarks.load_test --users 16 --compare benchmarks/results/load_<previous>.json
+
+With --url the traces go to a running server instead (RSS is then the client's).
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+from benchmarks.synthetic_data import CITIES, CUISINES, generate_csv
+from config import ANALYTICS_ENGINE, METRICS_ENABLED, SPATIAL_INDEX
+
+# pantalla de referencia para convertir zoom en grados de viewport
+SCREEN_PX = (1280, 800)
+ZOOM_PATH = [4, 6, 9, 12, 14, 16]
+CATALOG_PATHS = ["/catalogs", "/catalogs/locations", "/catalogs/cuisines", "/catalogs/meals"]
+SUMMARY_PATHS = ["/restaurants_by_country", "/top_tags_by_country",
+                 "/top_cuisines_by_country", "/avg_rating_by_cuisine"]
+COLLECTIONS = ["restaurants", "catalogs", "cluster_tiles", "summaries", "dataset_stats"]
+
+
+def viewport(lat: float, lon: float, zoom: int) -> dict:
+    width = SCREEN_PX[0] * 360.0 / (256 * 2 ** zoom)
+    height = width * SCREEN_PX[1] / SCREEN_PX[0]
+    return {
+        "north": round(min(90.0, lat + height / 2), 6),
+        "south": round(max(-90.0, lat - height / 2), 6),
+        "east":  round(min(180.0, lon + width / 2), 6),
+        "west":  round(max(-180.0, lon - width / 2), 6),
+        "zoom":  zoom,
+    }
+
+
+def make_trace(rng: random.Random, steps: int) -> list:
+    """
+    One user session: zoom from Europe into a city, pan around, zoom out and
+    pick another city; occasional filter changes, catalog and summary loads.
+    """
+    requests = [("GET", path, None, None) for path in CATALOG_PATHS[:2]]
+    filters: dict = {}
+    while len(requests) < steps:
+        _, _, city, lat, lon, spread = rng.choice(CITIES)
+        # el mapa arranca centrado en Europa y se acerca a la ciudad
+        for zoom in ZOOM_PATH:
+            t = ZOOM_PATH.index(zoom) / (len(ZOOM_PATH) - 1)
+            c_lat, c_lon = 50.0 + (lat - 50.0) * t, 10.0 + (lon - 10.0) * t
+            requests.append(("POST", "/analytics", viewport(c_lat, c_lon, zoom), filters))
+            for _ in range(rng.randint(0, 3) if zoom >= 12 else 0):
+                # pan de un 20-50 % del viewport
+                vp = viewport(c_lat, c_lon, zoom)
+                c_lat += (vp["north"] - vp["south"]) * rng.uniform(-0.5, 0.5)
+                c_lon += (vp["east"] - vp["west"]) * rng.uniform(-0.5, 0.5)
+                requests.append(("POST", "/analytics", viewport(c_lat, c_lon, zoom), filters))
+        r = rng.random()
+        if r < 0.3:
+            filters = {"country": rng.choice(CITIES)[0]}
+        elif r < 0.4:
+            filters = {"cuisines_list": rng.sample(CUISINES, 2)}
+        else:
+            filters = {}
+        if rng.random() < 0.3:
+            requests.append(("GET", rng.choice(CATALOG_PATHS), None, None))
+        if rng.random() < 0.3:
+            requests.append(("GET", rng.choice(SUMMARY_PATHS), None, None))
+    return requests[:steps]
+
+
+def label(method: str, path: str, params) -> str:
+    if path == "/analytics":
+        return f"/analytics z{params['zoom']}"
+    return path
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return math.nan
+    k = (len(sorted_values) - 1) * q
+    lo, hi = math.floor(k), math.ceil(k)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(latencies: list) -> dict:
+    values = sorted(latencies)
+    return {
+        "n":   len(values),
+        "p50": round(percentile(values, 0.50), 2),
+        "p95": round(percentile(values, 0.95), 2),
+        "p99": round(percentile(values, 0.99), 2),
+        "max": round(values[-1], 2) if values else math.nan,
+    }
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss en KB en Linux y en bytes en macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+async def run_user(client: httpx.AsyncClient, trace: list, deadline: float, results: dict):
+    etags: dict = {}
+    i = 0
+    while time.perf_counter() < deadline:
+        method, path, params, body = trace[i % len(trace)]
+        i += 1
+        headers = {"If-None-Match": etags[path]} if path in etags else {}
+        t0 = time.perf_counter()
+        try:
+            if method == "POST":
+                response = await client.post(path, params=params, json=body or {})
+            else:
+                response = await client.get(path, headers=headers)
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            response, ok = None, False
+        elapsed = (time.perf_counter() - t0) * 1000
+        entry = results.setdefault(label(method, path, params), {"latencies": [], "errors": 0, "cache": {}})
+        entry["latencies"].append(elapsed)
+        if not ok:
+            entry["errors"] += 1
+        elif response is not None:
+            if "etag" in response.headers:
+                etags[path] = response.headers["etag"]
+            status = response.headers.get("x-cache") or str(response.status_code)
+            entry["cache"][status] = entry["cache"].get(status, 0) + 1
+
+
+async def replay(client: httpx.AsyncClient, users: int, steps: int, duration: float, seed: int) -> dict:
+    traces = [make_trace(random.Random(seed + u), steps) for u in range(users)]
+    results: dict = {}
+    t0 = time.perf_counter()
+    deadline = t0 + duration
+    await asyncio.gather(*(run_user(client, trace, deadline, results) for trace in traces))
+    wall = time.perf_counter() - t0
+
+    endpoints = {
+        name: {**summarize(entry["latencies"]), "errors": entry["errors"], "cache": entry["cache"]}
+        for name, entry in sorted(results.items())
+    }
+    all_latencies = [v for entry in results.values() for v in entry["latencies"]]
+    return {
+        "requests":       len(all_latencies),
+        "errors":         sum(entry["errors"] for entry in results.values()),
+        "throughput_rps": round(len(all_latencies) / wall, 1),
+        "overall":        summarize(all_latencies),
+        "endpoints":      endpoints,
+    }
+
+
+async def ingest(csv_path: str, drop: bool, chunksize: int, tiles: bool) -> dict:
+    from database import db, ensure_indexes
+    from operations import insert_data_from_csv, rebuild_catalogs
+    from tiles import rebuild_cluster_tiles
+
+    if drop:
+        for name in COLLECTIONS:
+            await db[name].drop()
+        await ensure_indexes()
+    result = await insert_data_from_csv(csv_path, chunksize=chunksize)
+    t0 = time.perf_counter()
+    await rebuild_catalogs()
+    result["catalogs_seconds"] = round(time.perf_counter() - t0, 2)
+    if tiles:
+        t0 = time.perf_counter()
+        await rebuild_cluster_tiles()
+        result["tiles_seconds"] = round(time.perf_counter() - t0, 2)
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(current: dict, previous: dict, max_regression: float) -> list:
+    """
+    Print p50/p95 and throughput deltas; return the endpoints whose p95 regressed.
+    """
+    regressions = []
+    prev_endpoints = previous["load"]["endpoints"]
+    print(f"\ncompared with {previous['revision']} ({previous['started_at']})")
+    for name, stats in current["load"]["endpoints"].items():
+        old = prev_endpoints.get(name)
+        if not old or not old["p95"]:
+            continue
+        change = stats["p95"] / old["p95"] - 1
+        flag = "  REGRESSION" if change > max_regression else ""
+        print(f"{name:<28} p50 {old['p50']:8.2f} → {stats['p50']:8.2f}  "
+              f"p95 {old['p95']:8.2f} → {stats['p95']:8.2f} ms ({change:+.0%}){flag}")
+        if flag:
+            regressions.append(name)
+    old_rps, new_rps = previous["load"]["throughput_rps"], current["load"]["throughput_rps"]
+    print(f"{'throughput':<28} {old_rps} → {new_rps} req/s")
+    return regressions
+
+
+def print_report(run: dict):
+    if run.get("ingest"):
+        ing = run["ingest"]
+        print(f"ingest: {ing['rows']} rows in {ing['seconds']} s ({ing['rows_per_second']} rows/s), "
+              f"catalogs {ing['catalogs_seconds']} s, peak RSS {ing['peak_rss_mb']} MB")
+    load = run["load"]
+    print(f"{'endpoint':<28} {'n':>6} {'p50':>9} {'p95':>9} {'p99':>9}  errors")
+    for name, s in load["endpoints"].items():
+        print(f"{name:<28} {s['n']:>6} {s['p50']:>9.2f} {s['p95']:>9.2f} {s['p99']:>9.2f}  {s['errors']}")
+    o = load["overall"]
+    print(f"{'overall':<28} {o['n']:>6} {o['p50']:>9.2f} {o['p95']:>9.2f} {o['p99']:>9.2f}  {load['errors']}")
+    print(f"throughput: {load['throughput_rps']} req/s, peak RSS {run['peak_rss_mb']} MB ({run['rss_scope']})")
+
+
+async def main(args) -> int:
+    run = {
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "revision":   git_revision(),
+        "params":     {k: v for k, v in vars(args).items() if k != "compare"},
+        "settings":   {"ANALYTICS_ENGINE": ANALYTICS_ENGINE, "SPATIAL_INDEX": SPATIAL_INDEX,
+                       "METRICS_ENABLED": METRICS_ENABLED},
+        "ingest":     None,
+    }
+
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=60) as client:
+            run["load"] = await replay(client, args.users, args.steps, args.duration, args.seed)
+        run["rss_scope"] = "client"
+    else:
+        from app import app, lifespan
+
+        if args.ingest:
+            csv_path = args.csv
+            if csv_path is None:
+                csv_path = os.path.join(tempfile.gettempdir(), f"synthetic_{args.rows}.csv")
+                if not os.path.exists(csv_path):
+                    generate_csv(csv_path, args.rows, args.seed)
+            run["ingest"] = await ingest(csv_path, args.drop, args.chunksize, args.tiles)
+
+        async with lifespan(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+                run["load"] = await replay(client, args.users, args.steps, args.duration, args.seed)
+        run["rss_scope"] = "server+client"
+    run["peak_rss_mb"] = peak_rss_mb()
+
+    print_report(run)
+    os.makedirs(args.results_dir, exist_ok=True)
+    stamp = run["started_at"].replace(":", "").replace("-", "").replace("+0000", "")
+    out = os.path.join(args.results_dir, f"load_{stamp}_{run['revision']}.json")
+    with open(out, "w") as f:
+        json.dump(run, f, indent=2)
+    print(f"saved {out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        if compare(run, previous, args.max_regression):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", help="running server; default is the in-process app")
+    parser.add_argument("--ingest", action="store_true", help="ingest a CSV before the replay")
+    parser.add_argument("--csv", help="CSV to ingest; default generates --rows synthetic rows")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--drop", action="store_true", help="drop the dashboard collections first")
+    parser.add_argument("--tiles", action="store_true", help="also rebuild the cluster tile pyramid")
+    parser.add_argument("--chunksize", type=int, default=50_000)
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--steps", type=int, default=200, help="requests per user trace")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of replay")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--results-dir", default=os.path.join("benchmarks", "results"))
+    parser.add_argument("--compare", help="previous results JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="p95 increase that counts as a regression (exit code 1)")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,94 @@
+"""
+Parity check: the columnar engine must return the same /analytics payload as
+the Mongo $facet pipelines. Exits with status 1 on any mismatch and prints the
+latency of both engines.
+
+    python -m benchmarks.parity_columnar
+"""
+import asyncio
+import math
+import sys
+import time
+
+import columnar
+import tiles
+from analytics_endpoints import compute_analytics
+from models import FilterParams
+
+# (north, south, east, west, zoom)
+VIEWPORTS = [
+    (72.0, 34.0, 45.0, -25.0, 4),
+    (49.0, 41.0, 10.0, -5.0, 6),
+    (42.0, 40.5, 3.0, 1.0, 9.5),
+    (41.42, 41.36, 2.20, 2.12, 13),
+    (41.395, 41.38, 2.18, 2.16, 16),
+]
+
+FILTERS = [
+    FilterParams(),
+    FilterParams(country="Spain"),
+    FilterParams(country=["France", "Spain"], price_level_cat="caro"),
+    FilterParams(meal_list=["Lunch"], food=4.0),
+    FilterParams(top_tags_list=["Cheap Eats"], cuisines_list=["Italian", "Pizza"]),
+]
+
+
+def close(a, b, tol: float) -> bool:
+    if isinstance(a, float) or isinstance(b, float):
+        if a is None or b is None:
+            return a is b
+        return math.isclose(a, b, abs_tol=tol)
+    return a == b
+
+
+def diff(mongo: dict, col: dict) -> list:
+    problems = []
+    for k, v in mongo["overall_stats"].items():
+        if not close(v, col["overall_stats"][k], 0.011):
+            problems.append(f"overall_stats.{k}: {v} != {col['overall_stats'][k]}")
+    for key, label in (("meals_list", "meal"), ("top_tags_list", "tag")):
+        a = {d[label]: d["count"] for d in mongo[key]}
+        b = {d[label]: d["count"] for d in col[key]}
+        if a != b:
+            problems.append(f"{key} differs")
+    if "clusters" in mongo:
+        order = lambda c: (c["latitude"], c["longitude"])
+        a, b = sorted(mongo["clusters"], key=order), sorted(col["clusters"], key=order)
+        if len(a) != len(b) or any(
+            not close(x[k], y[k], 0.011) for x, y in zip(a, b) for k in x
+        ):
+            problems.append("clusters differ")
+    else:
+        if mongo["restaurants"] != col["restaurants"] or mongo["pagination"] != col["pagination"]:
+            problems.append("listing differs")
+    return problems
+
+
+async def run(engine: str, filters, vp) -> tuple:
+    columnar.ANALYTICS_ENGINE = engine
+    t0 = time.perf_counter()
+    payload = await compute_analytics(filters, *vp, limit=1000 if vp[-1] > 15 else 500)
+    return payload, (time.perf_counter() - t0) * 1000
+
+
+async def main() -> int:
+    # la pirámide devuelve celdas completas en los bordes: se compara con el $facet en vivo
+    tiles._ready = False
+    await columnar.engine.load()
+    failures, t_mongo, t_col = 0, [], []
+    for filters in FILTERS:
+        for vp in VIEWPORTS:
+            mongo, tm = await run("mongo", filters, vp)
+            col, tc = await run("columnar", filters, vp)
+            t_mongo.append(tm)
+            t_col.append(tc)
+            problems = diff(mongo, col)
+            failures += bool(problems)
+            print(f"{'OK ' if not problems else 'FAIL'} zoom={vp[-1]:<5} {filters.model_dump(exclude_none=True)} {problems}")
+    print(f"mongo    total {sum(t_mongo):9.1f} ms")
+    print(f"columnar total {sum(t_col):9.1f} ms  ({columnar.engine.size} rows in memory)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,71 @@
+"""
+Parity check for delta analytics: a chain of small pans answered with
+delta_token must give exactly the payload of a full pass over each viewport,
+and match the regular (non-delta) /analytics within rounding. Exits with
+status 1 on any mismatch and prints the latency of both modes.
+
+    python -m benchmarks.parity_delta
+"""
+import asyncio
+import sys
+import time
+
+import tiles
+from analytics_endpoints import compute_analytics, snap_bbox
+from benchmarks.parity_columnar import FILTERS, diff
+from models import FilterParams
+
+# (centro lat, centro lon, zoom, alto, ancho) y pasos de pan en fracción del viewport
+SESSIONS = [
+    (41.39, 2.17, 9, 1.5, 2.5),
+    (48.86, 2.35, 12, 0.2, 0.35),
+    (40.42, -3.70, 14, 0.05, 0.08),
+]
+PANS = [(0.0, 0.0), (0.1, 0.0), (0.1, 0.15), (-0.05, 0.2), (0.0, -0.3), (0.2, 0.2), (-0.1, -0.1)]
+
+
+def viewports(lat: float, lon: float, zoom: int, height: float, width: float) -> list:
+    out = []
+    for d_lat, d_lon in PANS:
+        lat += d_lat * height
+        lon += d_lon * width
+        out.append(snap_bbox(lat + height / 2, lat - height / 2, lon + width / 2, lon - width / 2, zoom) + (zoom,))
+    return out
+
+
+async def check(filters: FilterParams, session: tuple) -> tuple:
+    failures, t_full, t_delta = 0, 0.0, 0.0
+    token = None
+    for vp in viewports(*session):
+        t0 = time.perf_counter()
+        chained = await compute_analytics(filters, *vp, delta=True, delta_token=token)
+        t_delta += time.perf_counter() - t0
+        t0 = time.perf_counter()
+        full = await compute_analytics(filters, *vp, delta=True)
+        t_full += time.perf_counter() - t0
+        regular = await compute_analytics(filters, *vp)
+
+        token = chained.pop("delta_token")
+        full.pop("delta_token")
+        problems = ([] if chained == full else ["delta != full pass"]) + diff(regular, chained)
+        failures += bool(problems)
+        print(f"{'OK ' if not problems else 'FAIL'} zoom={vp[-1]:<3} {vp[:4]} "
+              f"{filters.model_dump(exclude_none=True)} {problems}")
+    return failures, t_full, t_delta
+
+
+async def main() -> int:
+    # los clusters regulares deben salir del $facet en vivo, no de la pirámide
+    tiles._ready = False
+    failures, t_full, t_delta = 0, 0.0, 0.0
+    for filters in FILTERS:
+        for session in SESSIONS:
+            f, tf, td = await check(filters, session)
+            failures, t_full, t_delta = failures + f, t_full + tf, t_delta + td
+    print(f"full pass total {t_full * 1000:9.1f} ms")
+    print(f"delta total     {t_delta * 1000:9.1f} ms")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,173 @@
+"""
+Synthetic TripAdvisor-shaped CSV generator: every column of models.Restaurant
+(except the derived fields computed at ingest), with restaurants clustered
+around real cities and heavy-tailed city sizes.
+
+    python -m benchmarks.synthetic_data --rows 1000000 --out /tmp/restaurants_1m.csv
+"""
+import argparse
+import csv
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_parsing import DAYS, SLOTS
+
+# (country, province, city, latitude, longitude, dispersión en grados)
+CITIES = [
+    ("Spain", "Community of Madrid", "Madrid", 40.4168, -3.7038, 0.08),
+    ("Spain", "Catalonia", "Barcelona", 41.3874, 2.1686, 0.06),
+    ("Spain", "Valencian Community", "Valencia", 39.4699, -0.3763, 0.05),
+    ("Spain", "Andalucia", "Seville", 37.3891, -5.9845, 0.05),
+    ("Spain", "Balearic Islands", "Palma de Mallorca", 39.5696, 2.6502, 0.15),
+    ("France", "Ile-de-France", "Paris", 48.8566, 2.3522, 0.07),
+    ("France", "Auvergne-Rhone-Alpes", "Lyon", 45.7640, 4.8357, 0.05),
+    ("France", "Provence-Alpes-Cote d'Azur", "Marseille", 43.2965, 5.3698, 0.06),
+    ("France", "Provence-Alpes-Cote d'Azur", "Nice", 43.7102, 7.2620, 0.04),
+    ("Italy", "Lazio", "Rome", 41.9028, 12.4964, 0.08),
+    ("Italy", "Lombardy", "Milan", 45.4642, 9.1900, 0.06),
+    ("Italy", "Tuscany", "Florence", 43.7696, 11.2558, 0.04),
+    ("Italy", "Campania", "Naples", 40.8518, 14.2681, 0.05),
+    ("Italy", "Veneto", "Venice", 45.4408, 12.3155, 0.03),
+    ("Germany", "Berlin", "Berlin", 52.5200, 13.4050, 0.09),
+    ("Germany", "Bavaria", "Munich", 48.1351, 11.5820, 0.06),
+    ("Germany", "Hamburg", "Hamburg", 53.5511, 9.9937, 0.07),
+    ("United Kingdom", "England", "London", 51.5074, -0.1278, 0.12),
+    ("United Kingdom", "England", "Manchester", 53.4808, -2.2426, 0.06),
+    ("United Kingdom", "Scotland", "Edinburgh", 55.9533, -3.1883, 0.04),
+    ("Portugal", "Lisbon District", "Lisbon", 38.7223, -9.1393, 0.05),
+    ("Portugal", "Porto District", "Porto", 41.1579, -8.6291, 0.04),
+    ("Netherlands", "North Holland", "Amsterdam", 52.3676, 4.9041, 0.05),
+    ("Belgium", "Brussels Capital Region", "Brussels", 50.8503, 4.3517, 0.05),
+    ("Austria", "Vienna", "Vienna", 48.2082, 16.3738, 0.06),
+    ("Czech Republic", "Prague", "Prague", 50.0755, 14.4378, 0.05),
+    ("Greece", "Attica", "Athens", 37.9838, 23.7275, 0.06),
+    ("Ireland", "County Dublin", "Dublin", 53.3498, -6.2603, 0.05),
+    ("Sweden", "Stockholm County", "Stockholm", 59.3293, 18.0686, 0.06),
+    ("Poland", "Lesser Poland Voivodeship", "Krakow", 50.0647, 19.9450, 0.04),
+]
+
+MEALS = ["Breakfast", "Lunch", "Dinner", "Brunch", "Late Night", "Drinks"]
+TAGS = ["Cheap Eats", "Mid-range", "Fine Dining", "Good for families", "Romantic", "Business meetings",
+        "Outdoor Seating", "Local cuisine", "Great View", "Hidden gem"]
+CUISINES = ["Spanish", "Italian", "French", "Mediterranean", "European", "Pizza", "Seafood", "Asian",
+            "Japanese", "Sushi", "Indian", "Mexican", "Bar", "Cafe", "Pub", "Vegetarian Friendly",
+            "Greek", "German", "British", "Portuguese", "Fast food", "International", "Steakhouse"]
+PRICE_LEVELS = [("€", "barato"), ("€€-€€€", "regular"), ("€€€€", "caro")]
+
+CHUNK = 100_000
+
+
+def _categories(values: np.ndarray) -> np.ndarray:
+    return np.select([values >= 4.5, values >= 3.5, values > 0], ["excelente", "bueno", "regular"], "sin_valorar")
+
+
+def _list_column(rng: np.random.Generator, vocabulary: list, n: int, max_items: int, missing: float) -> list:
+    # popularidad tipo Zipf: unos pocos valores dominan, como en el dataset real
+    weights = 1.0 / np.arange(1, len(vocabulary) + 1)
+    weights /= weights.sum()
+    sizes = rng.integers(1, max_items + 1, n)
+    picks = rng.choice(len(vocabulary), size=(n, max_items), p=weights)
+    out = []
+    for row, size, absent in zip(picks, sizes, rng.random(n) < missing):
+        if absent:
+            out.append("no_disponible")
+        else:
+            out.append(", ".join(vocabulary[i] for i in dict.fromkeys(row[:size])))
+    return out
+
+
+def _hours_column(rng: np.random.Generator, n: int, distinct: int = 2_000) -> np.ndarray:
+    # los horarios se repiten mucho entre restaurantes: catálogo acotado
+    schedules = []
+    for _ in range(distinct):
+        days = rng.choice(DAYS, size=rng.integers(3, 8), replace=False)
+        schedules.append(", ".join(f"{d}:{SLOTS[rng.integers(len(SLOTS))]}" for d in days))
+    schedules.append("no_disponible")
+    return np.array(schedules, dtype=object)[rng.integers(0, len(schedules), n)]
+
+
+def synthetic_chunk(rng: np.random.Generator, start: int, n: int) -> pd.DataFrame:
+    city_weights = 1.0 / np.arange(1, len(CITIES) + 1) ** 0.8
+    city_idx = rng.choice(len(CITIES), size=n, p=city_weights / city_weights.sum())
+    cities = np.array(CITIES, dtype=object)
+    spread = cities[city_idx, 5].astype(float)
+
+    avg_rating = np.round(rng.choice([0.0, 3.0, 3.5, 4.0, 4.5, 5.0], n, p=[0.08, 0.1, 0.2, 0.3, 0.25, 0.07]), 1)
+    food = np.round(np.clip(avg_rating + rng.normal(0, 0.4, n), 0, 5) * 2) / 2
+    service = np.round(np.clip(avg_rating + rng.normal(0, 0.4, n), 0, 5) * 2) / 2
+    value = np.round(np.clip(avg_rating + rng.normal(0, 0.5, n), 0, 5) * 2) / 2
+    reviews = rng.multinomial(rng.integers(1, 800, n), [0.45, 0.3, 0.13, 0.07, 0.05])
+    price = rng.choice(len(PRICE_LEVELS), n, p=[0.35, 0.5, 0.15])
+    open_days = rng.integers(0, 8, n)
+    pop_total = rng.integers(50, 5000, n)
+    ids = np.arange(start, start + n)
+
+    return pd.DataFrame({
+        "country":                      cities[city_idx, 0],
+        "restaurant_link":              [f"g{i % 9000 + 100000}-d{i + 1000000}" for i in ids],
+        "restaurant_name":              [f"Restaurant {i}" for i in ids],
+        "claimed":                      np.where(rng.random(n) < 0.6, "Claimed", "Unclaimed"),
+        "price_level":                  np.array([p[0] for p in PRICE_LEVELS], dtype=object)[price],
+        "vegetarian_friendly":          np.where(rng.random(n) < 0.4, "Y", "N"),
+        "vegan_options":                np.where(rng.random(n) < 0.2, "si", "no"),
+        "gluten_free":                  np.where(rng.random(n) < 0.15, "si", "no"),
+        "original_open_hours":          _hours_column(rng, n),
+        "popularity_detailed_location": [f"#{p} of {t} Restaurants in {c}" for p, t, c in
+                                         zip(rng.integers(1, 50, n), pop_total, cities[city_idx, 2])],
+        "popularity_generic_location":  [f"#{p} of {t} places to eat in {c}" for p, t, c in
+                                         zip(rng.integers(1, 50, n), pop_total, cities[city_idx, 2])],
+        "continent":                    "Europe",
+        "province":                     cities[city_idx, 1],
+        "city":                         cities[city_idx, 2],
+        "latitude":                     np.round(cities[city_idx, 3].astype(float) + rng.normal(0, 1, n) * spread, 6),
+        "longitude":                    np.round(cities[city_idx, 4].astype(float) + rng.normal(0, 1, n) * spread * 1.4, 6),
+        "avg_rating":                   avg_rating,
+        "food":                         food,
+        "service":                      service,
+        "value":                        value,
+        "open_days_per_week":           open_days,
+        "total_reviews_count":          reviews.sum(axis=1),
+        "excellent":                    reviews[:, 0],
+        "very_good":                    reviews[:, 1],
+        "average":                      reviews[:, 2],
+        "poor":                         reviews[:, 3],
+        "terrible":                     reviews[:, 4],
+        "pop_detailed_pos":             rng.integers(1, 50, n),
+        "pop_detailed_total":           pop_total,
+        "pop_generic_pos":              rng.integers(1, 50, n),
+        "pop_generic_total":            pop_total,
+        "meals_list":                   _list_column(rng, MEALS, n, 4, 0.2),
+        "top_tags_list":                _list_column(rng, TAGS, n, 3, 0.1),
+        "cuisines_list":                _list_column(rng, CUISINES, n, 4, 0.05),
+        "avg_rating_cat":               _categories(avg_rating),
+        "food_cat":                     _categories(food),
+        "service_cat":                  _categories(service),
+        "value_cat":                    _categories(value),
+        "open_days_per_week_cat":       np.where(open_days >= 6, "alta", np.where(open_days >= 3, "media", "baja")),
+        "price_level_cat":              np.array([p[1] for p in PRICE_LEVELS], dtype=object)[price],
+    })
+
+
+def generate_csv(path: str, rows: int, seed: int = 42) -> str:
+    """
+    Write `rows` synthetic restaurants to `path` in CHUNK-sized pieces (bounded memory).
+    """
+    rng = np.random.default_rng(seed)
+    for start in range(0, rows, CHUNK):
+        chunk = synthetic_chunk(rng, start, min(CHUNK, rows - start))
+        chunk.to_csv(path, mode="w" if start == 0 else "a", header=start == 0,
+                     index=False, quoting=csv.QUOTE_ALL, encoding="utf-8")
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--out", default="synthetic_restaurants.csv")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    t0 = time.perf_counter()
+    generate_csv(args.out, args.rows, args.seed)
+    print(f"{args.rows} rows → {args.out} in {time.perf_counter() - t0:.1f} s")
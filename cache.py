@@ -0,0 +1,122 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Hashable, Optional
+
+# Caché de respuestas serializadas (bytes JSON) con expulsión LRU + TTL y
+# coalescencia de peticiones idénticas concurrentes (single-flight)
+
+
+class TTLCache:
+    """
+    LRU cache with per-entry TTL, bounded by entry count and total bytes.
+    clear() bumps the generation so values computed before an invalidation
+    are not stored afterwards.
+    """
+
+    def __init__(self, max_entries: int = 512, max_bytes: int = 64 * 1024 * 1024, ttl: float = 60.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._size = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._pop(key)
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, value: bytes, generation: Optional[int] = None):
+        if generation is not None and generation != self.generation:
+            return
+        if len(value) > self.max_bytes:
+            return
+        if key in self._data:
+            self._pop(key)
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._size += len(value)
+        while len(self._data) > self.max_entries or self._size > self.max_bytes:
+            self._pop(next(iter(self._data)))
+            self.evictions += 1
+
+    def clear(self):
+        self._data.clear()
+        self._size = 0
+        self.generation += 1
+
+    def _pop(self, key: Hashable):
+        _, value = self._data.pop(key)
+        self._size -= len(value)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries":    len(self._data),
+            "bytes":      self._size,
+            "hits":       self.hits,
+            "misses":     self.misses,
+            "hit_ratio":  round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions":  self.evictions,
+            "generation": self.generation,
+        }
+
+
+analytics_cache = TTLCache()
+# estados aditivos de viewports para /analytics en modo delta (ver delta.py)
+delta_states = TTLCache(max_entries=2048, max_bytes=128 * 1024 * 1024, ttl=600)
+
+
+def invalidate_caches():
+    # Llamar siempre que cambien restaurantes o catálogos
+    analytics_cache.clear()
+    delta_states.clear()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first one runs the
+    coroutine, the rest await its result (or its exception).
+    """
+
+    def __init__(self):
+        self.leaders = 0
+        self.coalesced = 0
+        self._inflight: dict = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable]) -> tuple:
+        """
+        Returns (result, shared); shared is True when another call computed it.
+        """
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            # shield: si este cliente se desconecta no se cancela el cálculo de los demás
+            return await asyncio.shield(task), True
+        self.leaders += 1
+        task = asyncio.ensure_future(fn())
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task), False
+
+    def stats(self) -> dict:
+        requests = self.leaders + self.coalesced
+        return {
+            "inflight":       len(self._inflight),
+            "leaders":        self.leaders,
+            "coalesced":      self.coalesced,
+            "coalesce_ratio": round(self.coalesced / requests, 4) if requests else 0.0,
+        }
+
+
+analytics_flight = SingleFlight()
+summary_flight = SingleFlight()
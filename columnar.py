@@ -0,0 +1,243 @@
+import asyncio
+import math
+import time
+from typing import Optional
+
+import numpy as np
+
+from cache import invalidate_caches
+from config import ANALYTICS_ENGINE
+from database import collection
+from executors import run_cpu
+from tiles import cluster_cell_size, cluster_columns, tile_to_cluster
+
+# Motor columnar: la colección restaurants cargada en arrays NumPy para
+# responder filtros, estadísticas, distribuciones y clusters de /analytics
+# con máscaras vectorizadas y bincount, sin ir a MongoDB.
+
+CATEGORICAL_FIELDS = ("country", "province", "city", "claimed", "price_level_cat")
+NUMERIC_FIELDS = ("latitude", "longitude", "service", "food", "valid_rating", "price_numeric")
+LIST_FIELDS = ("meals_list", "top_tags_list", "cuisines_list")
+
+PROJECTION = {f: 1 for f in CATEGORICAL_FIELDS + NUMERIC_FIELDS + LIST_FIELDS + ("vegan", "gluten")}
+
+
+def _number(value) -> float:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return math.nan
+
+
+class Categorical:
+    """
+    Strings as int32 codes (-1 for missing / non-string values).
+    """
+
+    def __init__(self, values: list):
+        index: dict = {}
+        self.codes = np.fromiter(
+            (index.setdefault(v, len(index)) if isinstance(v, str) else -1 for v in values),
+            dtype=np.int32, count=len(values),
+        )
+        self.index = index
+
+    def isin(self, labels: list) -> np.ndarray:
+        wanted = [self.index[l] for l in labels if l in self.index]
+        return np.isin(self.codes, wanted)
+
+
+class ListColumn:
+    """
+    List field in CSR form: row of every element plus its dictionary code.
+    """
+
+    def __init__(self, values: list):
+        index: dict = {}
+        rows, codes = [], []
+        for row, lst in enumerate(values):
+            if isinstance(lst, list):
+                for v in lst:
+                    rows.append(row)
+                    codes.append(index.setdefault(v, len(index)))
+        self.rows = np.asarray(rows, dtype=np.int64)
+        self.codes = np.asarray(codes, dtype=np.int32)
+        self.labels = list(index)
+        self.index = index
+        self.size = len(values)
+
+    def any_of(self, labels: list) -> np.ndarray:
+        """
+        Rows containing at least one of labels (Mongo $in on an array field).
+        """
+        wanted = [self.index[l] for l in labels if l in self.index]
+        hit = np.isin(self.codes, wanted)
+        return np.bincount(self.rows[hit], minlength=self.size) > 0
+
+    def distribution(self, mask: np.ndarray, label: str) -> list:
+        """
+        Same as $unwind + $group count over the masked rows.
+        """
+        counts = np.bincount(self.codes[mask[self.rows]], minlength=len(self.labels))
+        return [{label: self.labels[c], "count": int(counts[c])} for c in np.flatnonzero(counts)]
+
+
+class ColumnarEngine:
+
+    def __init__(self):
+        self.loaded = False
+        self.size = 0
+        self.loaded_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def load(self):
+        """
+        Read the whole collection (sorted by _id) and rebuild the columns.
+        """
+        async with self._lock:
+            docs = await collection.find({}, PROJECTION).sort("_id", 1).to_list(length=None)
+            await run_cpu(self._build, docs)
+        # las respuestas cacheadas se calcularon con la versión anterior
+        invalidate_caches()
+
+    def _build(self, docs: list):
+        cats = {f: Categorical([d.get(f) for d in docs]) for f in CATEGORICAL_FIELDS}
+        nums = {f: np.array([_number(d.get(f)) for d in docs], dtype=np.float64) for f in NUMERIC_FIELDS}
+        lists = {f: ListColumn([d.get(f) for d in docs]) for f in LIST_FIELDS}
+        vegan = np.array([d.get("vegan") is True for d in docs], dtype=bool)
+        gluten = np.array([d.get("gluten") is True for d in docs], dtype=bool)
+        # ObjectId en binario (12 bytes big-endian): ordenable y buscable con searchsorted
+        ids = np.array([d["_id"].binary for d in docs], dtype="S12")
+
+        # asignación al final: las peticiones en curso ven la versión anterior entera
+        self.cats, self.nums, self.lists = cats, nums, lists
+        self.vegan, self.gluten, self.ids = vegan, gluten, ids
+        self.size = len(docs)
+        self.loaded_at = time.time()
+        self.loaded = True
+
+    def mask(self, filter_stage: dict, north: float, south: float, east: float, west: float) -> np.ndarray:
+        """
+        Boolean row mask equivalent to build_match_stage for the same filters and bbox.
+        """
+        lat, lon = self.nums["latitude"], self.nums["longitude"]
+        in_lon = (lon >= west) | (lon <= east) if west > east else (lon >= west) & (lon <= east)
+        m = (lat >= south) & (lat <= north) & in_lon
+        for fld, cond in filter_stage.items():
+            if fld in CATEGORICAL_FIELDS:
+                labels = cond["$in"] if isinstance(cond, dict) else [cond]
+                m &= self.cats[fld].isin(labels)
+            elif fld in LIST_FIELDS:
+                m &= self.lists[fld].any_of(cond["$in"])
+            elif fld in ("service", "food"):
+                m &= self.nums[fld] >= cond["$gte"]
+            else:
+                raise ValueError(f"Unsupported filter for the columnar engine: {fld}")
+        return m
+
+    def stats(self, m: np.ndarray) -> Optional[dict]:
+        """
+        Same sums as the stats facet, or None when nothing matches.
+        """
+        total = int(m.sum())
+        if not total:
+            return None
+        rating = self.nums["valid_rating"][m]
+        price = self.nums["price_numeric"][m]
+        rated, priced = ~np.isnan(rating), ~np.isnan(price)
+        return {
+            "total":             total,
+            "vegan_count":       int(self.vegan[m].sum()),
+            "gluten_free_count": int(self.gluten[m].sum()),
+            "rating_sum":        float(rating[rated].sum()),
+            "rating_count":      int(rated.sum()),
+            "premium_count":     int((price == 3).sum()),
+            "price_sum":         float(price[priced].sum()),
+            "price_count":       int(priced.sum()),
+        }
+
+    def clusters(self, m: np.ndarray, cell_size: float, limit: int, columnar: bool = False):
+        """
+        Grid clustering with bincount per cell; same shape as cluster_facet,
+        or struct-of-arrays (cluster_columns) with columnar.
+        """
+        lat, lon = self.nums["latitude"][m], self.nums["longitude"][m]
+        if not len(lat):
+            return cluster_columns({}) if columnar else []
+        cx = np.floor((lon + 180) / cell_size).astype(np.int64)
+        cy = np.floor((lat + 90) / cell_size).astype(np.int64)
+        cells, inverse = np.unique(cx * (int(180 / cell_size) + 2) + cy, return_inverse=True)
+        n = len(cells)
+
+        def per_cell(weights=None):
+            return np.bincount(inverse, weights=weights, minlength=n)
+
+        rating = self.nums["valid_rating"][m]
+        price = self.nums["price_numeric"][m]
+        rated, priced = ~np.isnan(rating), ~np.isnan(price)
+        sums = {
+            "total":             per_cell(),
+            "lat_sum":           per_cell(lat),
+            "lon_sum":           per_cell(lon),
+            "vegan_count":       per_cell(self.vegan[m]),
+            "gluten_free_count": per_cell(self.gluten[m]),
+            "rating_sum":        per_cell(np.where(rated, rating, 0.0)),
+            "rating_count":      per_cell(rated),
+            "premium_count":     per_cell(price == 3),
+            "price_sum":         per_cell(np.where(priced, price, 0.0)),
+            "price_count":       per_cell(priced),
+        }
+        if columnar:
+            return cluster_columns({k: v[:limit] for k, v in sums.items()})
+        counts = {"total", "vegan_count", "gluten_free_count", "rating_count", "premium_count", "price_count"}
+        out = []
+        for i in range(min(n, limit)):
+            cell = {k: int(v[i]) if k in counts else float(v[i]) for k, v in sums.items()}
+            out.append(tile_to_cluster(cell))
+        return out
+
+    def facets(self, filter_stage: dict, north: float, south: float, east: float,
+               west: float, zoom: float, limit: int, columnar: bool = False) -> tuple:
+        """
+        Result shaped like the Mongo $facet document, plus the row mask for the listing.
+        """
+        m = self.mask(filter_stage, north, south, east, west)
+        stats_doc = self.stats(m)
+        res = {
+            "stats":         [stats_doc] if stats_doc else [],
+            "meals_list":    self.lists["meals_list"].distribution(m, "meal"),
+            "top_tags_list": self.lists["top_tags_list"].distribution(m, "tag"),
+        }
+        if zoom <= 15:
+            res["clusters"] = self.clusters(m, cluster_cell_size(zoom), limit, columnar)
+        return res, m
+
+    def listing_ids(self, m: np.ndarray, after: Optional[bytes], skip: int, limit: int) -> list:
+        """
+        _ids (as bytes) of one listing page in _id order, by skip or keyset.
+        """
+        rows = np.flatnonzero(m)
+        if after is not None:
+            start = np.searchsorted(self.ids[rows], np.bytes_(after), side="right")
+            rows = rows[start:]
+        else:
+            rows = rows[skip:]
+        # el dtype S quita los \x00 finales: se restauran los 12 bytes
+        return [bytes(b).ljust(12, b"\x00") for b in self.ids[rows[:limit]]]
+
+
+engine = ColumnarEngine()
+
+
+def active_engine() -> Optional[ColumnarEngine]:
+    """
+    The columnar engine when selected by config and loaded, otherwise None.
+    """
+    if ANALYTICS_ENGINE == "columnar" and engine.loaded:
+        return engine
+    return None
+
+
+async def reload_engine():
+    # Tras una ingesta: solo si el motor columnar está seleccionado
+    if ANALYTICS_ENGINE == "columnar":
+        await engine.load()
@@ -0,0 +1,37 @@
+import os
+
+# Motor de /analytics: "mongo" (pipelines $facet) o "columnar" (arrays NumPy en memoria)
+ANALYTICS_ENGINE = os.getenv("ANALYTICS_ENGINE", "mongo").lower()
+
+# Índice espacial en proceso (rejilla) para resolver el bbox en _ids candidatos
+SPATIAL_INDEX = os.getenv("SPATIAL_INDEX", "0").lower() in ("1", "true", "yes")
+SPATIAL_CELL_ZOOM = int(os.getenv("SPATIAL_CELL_ZOOM", "12"))
+SPATIAL_MAX_CANDIDATES = int(os.getenv("SPATIAL_MAX_CANDIDATES", "10000"))
+
+# MongoDB: conexión y pool del cliente Motor
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
+MONGO_DB = os.getenv("MONGO_DB", "tripadvisor_db")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "10000"))
+# "zstd,snappy,zlib": zstd y snappy requieren los paquetes zstandard / python-snappy
+MONGO_COMPRESSORS = [c.strip() for c in os.getenv("MONGO_COMPRESSORS", "").split(",") if c.strip()]
+MONGO_READ_PREFERENCE = os.getenv("MONGO_READ_PREFERENCE", "primary")
+# lecturas de /analytics y resúmenes, p. ej. "secondaryPreferred" para enviarlas a secundarios
+ANALYTICS_READ_PREFERENCE = os.getenv("ANALYTICS_READ_PREFERENCE", MONGO_READ_PREFERENCE)
+# límites de las agregaciones (0 = sin maxTimeMS)
+AGGREGATE_MAX_TIME_MS = int(os.getenv("AGGREGATE_MAX_TIME_MS", "15000"))
+AGGREGATE_ALLOW_DISK_USE = os.getenv("AGGREGATE_ALLOW_DISK_USE", "1").lower() in ("1", "true", "yes")
+
+# Instrumentación (spans, Server-Timing y /metrics); desactivada no añade trabajo por petición
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "0").lower() in ("1", "true", "yes")
+
+# Ejecutores para trabajo de CPU fuera del event loop
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(min(4, os.cpu_count() or 1))))
+# >0: el parseo de la ingesta (pandas + horarios) va a un pool de procesos
+INGEST_PROCESSES = int(os.getenv("INGEST_PROCESSES", "0"))
+
+# Muestra estratificada (por país) para /analytics?approx=true a zoom bajo
+SAMPLE_SIZE = int(os.getenv("SAMPLE_SIZE", "50000"))
+SAMPLE_MIN_PER_STRATUM = int(os.getenv("SAMPLE_MIN_PER_STRATUM", "100"))
@@ -1,10 +1,178 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, GEO2D, ReadPreference
+from pymongo.monitoring import ConnectionPoolListener
 
-# Crear cliente de MongoDB
-client = AsyncIOMotorClient('mongodb://localhost:27017')
+from config import (
+    AGGREGATE_ALLOW_DISK_USE, AGGREGATE_MAX_TIME_MS, ANALYTICS_READ_PREFERENCE,
+    MONGO_COMPRESSORS, MONGO_DB, MONGO_MAX_IDLE_TIME_MS, MONGO_MAX_POOL_SIZE,
+    METRICS_ENABLED, MONGO_MIN_POOL_SIZE, MONGO_READ_PREFERENCE, MONGO_URI, MONGO_WAIT_QUEUE_TIMEOUT_MS,
+)
+from metrics import command_monitor
+
+READ_PREFERENCES = {
+    "primary":            ReadPreference.PRIMARY,
+    "primarypreferred":   ReadPreference.PRIMARY_PREFERRED,
+    "secondary":          ReadPreference.SECONDARY,
+    "secondarypreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest":            ReadPreference.NEAREST,
+}
+
+
+class PoolMonitor(ConnectionPoolListener):
+    """
+    Connection pool counters from the driver's pool events.
+    """
+
+    def __init__(self):
+        self.created = 0
+        self.closed = 0
+        self.checked_out = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.cleared = 0
+
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_closed(self, event): pass
+    def connection_ready(self, event): pass
+    def connection_check_out_started(self, event): pass
+
+    def pool_cleared(self, event):
+        self.cleared += 1
+
+    def connection_created(self, event):
+        self.created += 1
+
+    def connection_closed(self, event):
+        self.closed += 1
+
+    def connection_check_out_failed(self, event):
+        self.checkout_failures += 1
+
+    def connection_checked_out(self, event):
+        self.checkouts += 1
+        self.checked_out += 1
+
+    def connection_checked_in(self, event):
+        self.checked_out -= 1
+
+    def stats(self) -> dict:
+        return {
+            "max_pool_size":     MONGO_MAX_POOL_SIZE,
+            "min_pool_size":     MONGO_MIN_POOL_SIZE,
+            "open":              self.created - self.closed,
+            "in_use":            self.checked_out,
+            "checkouts":         self.checkouts,
+            "checkout_failures": self.checkout_failures,
+            "created":           self.created,
+            "closed":            self.closed,
+            "cleared":           self.cleared,
+            "compressors":       MONGO_COMPRESSORS,
+            "read_preference":   MONGO_READ_PREFERENCE,
+            "analytics_read_preference": ANALYTICS_READ_PREFERENCE,
+        }
+
+
+pool_monitor = PoolMonitor()
+
+# connect=False: sin hilos ni conexiones al importar; se conecta en el lifespan de la app
+client = AsyncIOMotorClient(
+    MONGO_URI,
+    connect=False,
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+    waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    readPreference=MONGO_READ_PREFERENCE,
+    event_listeners=[pool_monitor] + ([command_monitor] if METRICS_ENABLED else []),
+    **({"compressors": ",".join(MONGO_COMPRESSORS)} if MONGO_COMPRESSORS else {}),
+)
 
 # Base de datos
-db = client["tripadvisor_db"]
+db = client[MONGO_DB]
 
 # Colección de restaurantes
 collection = db["restaurants"]
+
+# Misma colección con la read preference de las lecturas analíticas
+analytics_collection = collection.with_options(
+    read_preference=READ_PREFERENCES[ANALYTICS_READ_PREFERENCE.lower()]
+)
+
+
+def aggregate_options(max_time: bool = True) -> dict:
+    """
+    Options for aggregate(): allowDiskUse and, for request-time queries, maxTimeMS.
+    """
+    options = {"allowDiskUse": AGGREGATE_ALLOW_DISK_USE}
+    if max_time and AGGREGATE_MAX_TIME_MS:
+        options["maxTimeMS"] = AGGREGATE_MAX_TIME_MS
+    return options
+
+
+async def connect():
+    # falla al arrancar (y no en la primera petición) si MongoDB no responde
+    await client.admin.command("ping")
+
+
+def close():
+    client.close()
+
+# Índices compuestos según FilterParams: igualdad primero, luego el rango del bbox
+FILTER_INDEXES = [
+    [("latitude", ASCENDING), ("longitude", ASCENDING)],
+    [("country", ASCENDING), ("latitude", ASCENDING), ("longitude", ASCENDING)],
+    [("province", ASCENDING), ("latitude", ASCENDING), ("longitude", ASCENDING)],
+    [("city", ASCENDING), ("latitude", ASCENDING), ("longitude", ASCENDING)],
+    [("price_level_cat", ASCENDING), ("latitude", ASCENDING), ("longitude", ASCENDING)],
+    [("meals_list", ASCENDING), ("latitude", ASCENDING), ("longitude", ASCENDING)],
+    [("cuisines_list", ASCENDING), ("latitude", ASCENDING), ("longitude", ASCENDING)],
+    [("top_tags_list", ASCENDING), ("latitude", ASCENDING), ("longitude", ASCENDING)],
+]
+
+
+async def ensure_indexes():
+    """
+    Create the geospatial and filter indexes; create_index is a no-op when they exist.
+    """
+    # location = [longitude, latitude]; max=181 para incluir longitude 180
+    await collection.create_index([("location", GEO2D)], name="location_2d", min=-180, max=181)
+    for keys in FILTER_INDEXES:
+        await collection.create_index(keys)
+    # búsqueda de los documentos existentes en la ingesta con upsert
+    await collection.create_index("restaurant_link")
+    await db["catalogs"].create_index("tipo", unique=True)
+    await db["cluster_tiles"].create_index(
+        [("key", ASCENDING), ("zoom", ASCENDING), ("x", ASCENDING), ("y", ASCENDING)]
+    )
+
+
+def plan_stages(plan) -> set:
+    """
+    Collect every stage name ("IXSCAN", "COLLSCAN", ...) of an explain output.
+    """
+    stages = set()
+    if isinstance(plan, dict):
+        for key, value in plan.items():
+            if key == "stage" and isinstance(value, str):
+                stages.add(value)
+            else:
+                stages |= plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            stages |= plan_stages(item)
+    return stages
+
+
+async def explain_aggregate(pipeline: list) -> set:
+    explain = await db.command(
+        "explain",
+        {"aggregate": collection.name, "pipeline": pipeline, "cursor": {}},
+        verbosity="queryPlanner",
+    )
+    return plan_stages(explain)
+
+
+async def explain_find(query: dict) -> set:
+    explain = await collection.find(query).explain()
+    return plan_stages(explain)
@@ -0,0 +1,61 @@
+import time
+from datetime import datetime, timezone
+from database import db, collection
+
+# Estadísticas globales del dataset (por ahora el total de restaurantes),
+# persistidas en dataset_stats y cacheadas en memoria.
+stats = db["dataset_stats"]
+
+STATS_ID = "restaurants"
+REFRESH_SECONDS = 300
+
+_count: dict = {"value": None, "loaded_at": 0.0}
+
+
+def _remember(count: int) -> int:
+    _count["value"] = count
+    _count["loaded_at"] = time.monotonic()
+    return count
+
+
+async def recount_restaurants() -> int:
+    """
+    Exact count_documents({}) stored as the new dataset statistics record.
+    """
+    count = await collection.count_documents({})
+    await stats.replace_one(
+        {"_id": STATS_ID},
+        {"_id": STATS_ID, "count": count, "exact": True, "updated_at": datetime.now(timezone.utc)},
+        upsert=True,
+    )
+    return _remember(count)
+
+
+async def restaurant_count(exact: bool = False) -> int:
+    """
+    Total restaurants: in-memory value, refreshed from the stats record every
+    REFRESH_SECONDS, or estimated_document_count when no record exists yet.
+    """
+    if exact:
+        return await recount_restaurants()
+    if _count["value"] is not None and time.monotonic() - _count["loaded_at"] < REFRESH_SECONDS:
+        return _count["value"]
+    doc = await stats.find_one({"_id": STATS_ID})
+    if doc is not None:
+        return _remember(doc["count"])
+    return _remember(await collection.estimated_document_count())
+
+
+async def add_restaurants(inserted: int):
+    # La ingesta suma lo insertado; sin registro previo se hará un recuento exacto
+    if not inserted:
+        return
+    result = await stats.update_one(
+        {"_id": STATS_ID},
+        {"$inc": {"count": inserted}, "$set": {"updated_at": datetime.now(timezone.utc)}},
+    )
+    if result.matched_count:
+        if _count["value"] is not None:
+            _remember(_count["value"] + inserted)
+    else:
+        await recount_restaurants()
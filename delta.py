@@ -0,0 +1,138 @@
+import json
+import uuid
+from typing import Optional
+
+from cache import delta_states
+from tiles import CELL_SUMS, cells_to_columns, tile_to_cluster
+from utils import dumps
+
+# Analíticas delta para pans pequeños: el estado aditivo de un viewport
+# (sumas globales, conteos de comidas/etiquetas y sumas por celda) se guarda
+# con un token; el siguiente viewport se obtiene sumando las franjas que
+# entran y restando las que salen.
+
+# fracción máxima del viewport nuevo que puede cambiar para usar el delta
+DELTA_MAX_CHANGED = 0.5
+
+STAT_KEYS = ("total", "vegan_count", "gluten_free_count", "rating_sum", "rating_count",
+             "premium_count", "price_sum", "price_count")
+
+
+def intersection(a: tuple, b: tuple) -> Optional[tuple]:
+    """
+    Intersection of two (north, south, east, west) boxes, or None if they do not overlap.
+    """
+    north, south = min(a[0], b[0]), max(a[1], b[1])
+    east, west = min(a[2], b[2]), max(a[3], b[3])
+    if north < south or east < west:
+        return None
+    return north, south, east, west
+
+
+def area(box: tuple) -> float:
+    return (box[0] - box[1]) * (box[2] - box[3])
+
+
+def difference(outer: tuple, inner: tuple) -> list:
+    """
+    outer minus inner (inner inside outer) as disjoint latitude/longitude
+    conditions: bounds on inner edges are exclusive, as inner keeps those points.
+    """
+    n, s, e, w = outer
+    i_n, i_s, i_e, i_w = inner
+    rects = []
+    if n > i_n:
+        rects.append({"latitude": {"$gt": i_n, "$lte": n}, "longitude": {"$gte": w, "$lte": e}})
+    if s < i_s:
+        rects.append({"latitude": {"$gte": s, "$lt": i_s}, "longitude": {"$gte": w, "$lte": e}})
+    if w < i_w:
+        rects.append({"latitude": {"$gte": i_s, "$lte": i_n}, "longitude": {"$gte": w, "$lt": i_w}})
+    if e > i_e:
+        rects.append({"latitude": {"$gte": i_s, "$lte": i_n}, "longitude": {"$gt": i_e, "$lte": e}})
+    return rects
+
+
+def strips_match(filter_stage: dict, rects: list) -> Optional[dict]:
+    if not rects:
+        return None
+    return {**filter_stage, "$or": rects}
+
+
+def plan_delta(state: Optional[dict], filter_key: str, bbox: tuple, zoom: float) -> Optional[tuple]:
+    """
+    (entering strips, leaving strips) from the previous state to bbox, or None
+    when a full pass is needed: no state, other filters or zoom, antimeridian
+    viewports, no overlap, or too large a change.
+    """
+    if state is None or state["filters"] != filter_key or state["zoom"] != zoom:
+        return None
+    old = tuple(state["bbox"])
+    if old[3] > old[2] or bbox[3] > bbox[2]:
+        return None
+    common = intersection(old, bbox)
+    if common is None or area(bbox) <= 0:
+        return None
+    changed = area(bbox) + area(old) - 2 * area(common)
+    if changed > DELTA_MAX_CHANGED * area(bbox):
+        return None
+    return difference(bbox, common), difference(old, common)
+
+
+def new_state(filter_key: str, bbox: tuple, zoom: float) -> dict:
+    return {"filters": filter_key, "bbox": list(bbox), "zoom": zoom,
+            "stats": dict.fromkeys(STAT_KEYS, 0), "meals": {}, "tags": {}, "cells": {}}
+
+
+def apply_facets(state: dict, res: dict, sign: int = 1):
+    """
+    Add (sign=1) or subtract (sign=-1) one $facet result of delta_facets to the state.
+    """
+    for doc in res.get("stats", []):
+        for k in STAT_KEYS:
+            state["stats"][k] += sign * doc[k]
+    for field, label, counts in (("meals_list", "meal", state["meals"]), ("top_tags_list", "tag", state["tags"])):
+        for item in res.get(field, []):
+            # clave str: el estado se serializa a JSON (un código sin etiqueta es un int)
+            key = str(item[label])
+            value = counts.get(key, 0) + sign * item["count"]
+            if value:
+                counts[key] = value
+            else:
+                counts.pop(key, None)
+    for cell in res.get("cells", []):
+        key = f"{int(cell['_id']['x'])},{int(cell['_id']['y'])}"
+        sums = state["cells"].setdefault(key, dict.fromkeys(CELL_SUMS, 0))
+        for k in CELL_SUMS:
+            sums[k] += sign * cell[k]
+        if not sums["total"]:
+            del state["cells"][key]
+
+
+def finalize(state: dict, limit: int, columnar: bool = False) -> dict:
+    """
+    Result shaped like mongo_facets from the state; deterministic order, so a
+    delta and a full pass over the same viewport give the same payload.
+    """
+    def items(counts: dict, label: str) -> list:
+        return [{label: k, "count": v} for k, v in sorted(counts.items(), key=lambda kv: (-kv[1], kv[0]))]
+
+    cells = sorted(state["cells"].items(), key=lambda kv: tuple(int(v) for v in kv[0].split(",")))
+    return {
+        "stats":         [dict(state["stats"])] if state["stats"]["total"] else [],
+        "meals_list":    items(state["meals"], "meal"),
+        "top_tags_list": items(state["tags"], "tag"),
+        "clusters":      (cells_to_columns([sums for _, sums in cells[:limit]]) if columnar else
+                          [tile_to_cluster(sums) for _, sums in cells[:limit]]),
+    }
+
+
+def load_state(token: str) -> Optional[dict]:
+    body = delta_states.get(token)
+    return None if body is None else json.loads(body)
+
+
+def save_state(state: dict, generation: int) -> str:
+    # generation: no se guarda un estado calculado antes de una invalidación
+    token = uuid.uuid4().hex
+    delta_states.set(token, dumps(state), generation)
+    return token
@@ -1,5 +1,14 @@
-from fastapi import APIRouter, HTTPException
-from operations import get_catalog, insert_data_from_csv, get_open_hours, list_catalogs, rebuild_catalogs
+from typing import Optional
+from fastapi import APIRouter, File, HTTPException, Query, Request, Response, UploadFile
+from tiles import rebuild_cluster_tiles
+from fastapi.responses import PlainTextResponse
+from database import pool_monitor
+from config import METRICS_ENABLED
+from metrics import render
+from operations import CATALOG_MAX_AGE, backfill_derived_fields, cached_catalog, get_open_hours, rebuild_catalogs, rebuild_summaries
+from jobs import get_job, list_jobs, save_upload, start_ingest, wait_job
+from executors import executor_stats
+from sampling import rebuild_sample
 
 router = APIRouter()
 
@@ -7,9 +16,68 @@ router = APIRouter()
 async def root():
     return {"message": "FastAPI funcionando correctamente"}
 
-@router.post("/insert_data")
-async def insert_data():
-    return await insert_data_from_csv("c:/Users/casal/Downloads/clean_tripadvisor3.csv")
+@router.get("/db/pool", summary="Estado del pool de conexiones a MongoDB")
+async def db_pool_stats():
+    return pool_monitor.stats()
+
+@router.get("/executors", summary="Estado de los pools de CPU")
+async def executors_status():
+    return executor_stats()
+
+@router.get("/metrics", response_class=PlainTextResponse, summary="Métricas en formato Prometheus")
+async def metrics():
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Métricas desactivadas (METRICS_ENABLED=0)")
+    pool = pool_monitor.stats()
+    return render({
+        "mongo_pool_connections_open":   pool["open"],
+        "mongo_pool_connections_in_use": pool["in_use"],
+        "mongo_pool_checkout_failures":  pool["checkout_failures"],
+    })
+
+@router.post("/insert_data", status_code=202)
+async def insert_data(
+    path: Optional[str] = Query(None, description="Ruta del CSV en el servidor"),
+    file: Optional[UploadFile] = File(None),
+    chunksize: int = Query(50_000, ge=1),
+    max_inflight: int = Query(4, ge=1, le=32),
+    upsert: bool = Query(False, description="Upsert idempotente por restaurant_link"),
+    wait: bool = Query(False, description="Esperar a que termine la ingesta"),
+):
+    if file is None and not path:
+        raise HTTPException(status_code=400, detail="Indica 'path' o sube un fichero CSV")
+    if file is not None:
+        source, filepath = file.filename, await save_upload(file.file)
+    else:
+        source, filepath = path, path
+    job = start_ingest(filepath, source, cleanup=file is not None,
+                       chunksize=chunksize, max_inflight=max_inflight, upsert=upsert)
+    if wait:
+        await wait_job(job["id"])
+    return {**get_job(job["id"]), "status_url": f"/insert_data/jobs/{job['id']}"}
+
+@router.get("/insert_data/jobs", summary="Trabajos de ingesta recientes")
+async def ingest_jobs():
+    return list_jobs()
+
+@router.get("/insert_data/jobs/{job_id}", summary="Estado y progreso de una ingesta")
+async def ingest_job(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo de ingesta no encontrado")
+    return job
+
+@router.post("/migrations/derived_fields", summary="Materializar campos derivados en documentos existentes")
+async def migrate_derived_fields():
+    return await backfill_derived_fields()
+
+@router.post("/sample/build", summary="(Re)construir la muestra estratificada de approx=true")
+async def build_sample():
+    return await rebuild_sample()
+
+@router.post("/tiles/build", summary="(Re)construir la pirámide de clusters")
+async def build_cluster_tiles():
+    return await rebuild_cluster_tiles()
 
 @router.get("/get_open_hours")
 async def fetch_open_hours():
@@ -24,15 +92,27 @@ async def fetch_open_hours():
 async def build_all_catalogs():
     return await rebuild_catalogs()
 
+@router.post("/summaries/build", summary="(Re)construir resúmenes por país")
+async def build_summaries():
+    return await rebuild_summaries()
+
+def catalog_response(request: Request, entry: dict) -> Response:
+    # 304 si el cliente ya tiene esta versión (If-None-Match)
+    headers = {"ETag": entry["etag"], "Cache-Control": f"public, max-age={CATALOG_MAX_AGE}"}
+    if_none_match = request.headers.get("if-none-match", "")
+    tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+    if entry["etag"] in tags or "*" in tags:
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry["body"], media_type="application/json", headers=headers)
+
 @router.get("/catalogs", summary="Listar todos los catálogos")
-async def fetch_all_catalogs():
-    catalogs = await list_catalogs()
-    return {"catalogs": catalogs}
+async def fetch_all_catalogs(request: Request):
+    entry = await cached_catalog("*")
+    return catalog_response(request, entry)
 
 @router.get("/catalogs/{catalog_type}", summary="Obtener un catálogo por tipo")
-async def fetch_catalog(catalog_type: str):
-    doc = await get_catalog(catalog_type)
-    if not doc:
+async def fetch_catalog(catalog_type: str, request: Request):
+    entry = await cached_catalog(catalog_type)
+    if not entry:
         raise HTTPException(status_code=404, detail=f"Catálogo '{catalog_type}' no existe")
-    # doc ya está limpio
-    return doc["items"]
\ No newline at end of file
+    return catalog_response(request, entry)
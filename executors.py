@@ -0,0 +1,51 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional
+
+from config import CPU_WORKERS, INGEST_PROCESSES
+
+# Pools dedicados para el trabajo de CPU (parseo, serialización de payloads
+# grandes, motor columnar), separados del executor por defecto del loop.
+
+cpu_executor = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="cpu")
+_process_executor: Optional[ProcessPoolExecutor] = None
+
+
+async def run_cpu(fn: Callable, *args, **kwargs):
+    """
+    Run fn in the CPU thread pool; the caller's context (metric spans) goes along.
+    """
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, fn, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(cpu_executor, call)
+
+
+async def run_parse(fn: Callable, *args):
+    """
+    Ingest parsing: in the process pool when INGEST_PROCESSES > 0 (fn and args
+    must be picklable), otherwise in the CPU thread pool.
+    """
+    global _process_executor
+    if INGEST_PROCESSES <= 0:
+        return await run_cpu(fn, *args)
+    if _process_executor is None:
+        _process_executor = ProcessPoolExecutor(max_workers=INGEST_PROCESSES)
+    return await asyncio.get_running_loop().run_in_executor(_process_executor, fn, *args)
+
+
+def executor_stats() -> dict:
+    return {
+        "cpu_workers":      CPU_WORKERS,
+        "cpu_queue":        cpu_executor._work_queue.qsize(),
+        "ingest_processes": INGEST_PROCESSES,
+    }
+
+
+def shutdown_executors():
+    global _process_executor
+    cpu_executor.shutdown(wait=False, cancel_futures=True)
+    if _process_executor is not None:
+        _process_executor.shutdown(wait=False, cancel_futures=True)
+        _process_executor = None
@@ -0,0 +1,100 @@
+from typing import Optional
+
+import numpy as np
+
+from utils import dumps
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - sin msgpack solo se ofrecen los formatos JSON
+    msgpack = None
+
+# Formatos compactos de /analytics elegidos por cabecera Accept: clusters y
+# listado como struct-of-arrays (un array por campo, sin repetir las claves)
+# en JSON o en MessagePack con arrays tipados.
+
+JSON = "application/json"
+COLUMNAR = "application/vnd.dashboard.columnar+json"
+MSGPACK = "application/x-msgpack"
+
+# columnas numéricas enviadas como arrays tipados little-endian en MessagePack;
+# los null de las columnas float viajan como NaN
+COLUMN_DTYPES = {
+    "total_restaurants": "<u4",
+    "vegan_count":       "<u4",
+    "gluten_free_count": "<u4",
+    "premium_count":     "<u4",
+    "latitude":          "<f8",
+    "longitude":         "<f8",
+    "avg_rating":        "<f4",
+    "pct_vegan":         "<f4",
+    "pct_gluten_free":   "<f4",
+    "pct_avg_rating":    "<f4",
+    "pct_premium":       "<f4",
+}
+
+COLUMNAR_FIELDS = ("clusters", "restaurants")
+
+
+def available_formats() -> list:
+    return [JSON, COLUMNAR] + ([MSGPACK] if msgpack is not None else [])
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """
+    Media type for an Accept header: highest q among the available formats,
+    JSON for wildcards, a missing header or nothing acceptable.
+    """
+    if not accept:
+        return JSON
+    offered = available_formats()
+    best, best_q = JSON, 0.0
+    for part in accept.split(","):
+        media_type, *params = [p.strip() for p in part.split(";")]
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if media_type in ("*/*", "application/*"):
+            media_type = JSON
+        if media_type in offered and q > best_q:
+            best, best_q = media_type, q
+    return best
+
+
+def is_columnar(media_type: str) -> bool:
+    return media_type != JSON
+
+
+def listing_columns(docs: list, fields: list) -> dict:
+    """
+    Struct-of-arrays version of the listing documents; missing fields become null.
+    """
+    return {field: [doc.get(field) for doc in docs] for field in fields}
+
+
+def _typed(columns: dict) -> dict:
+    out = {}
+    for name, values in columns.items():
+        dtype = COLUMN_DTYPES.get(name)
+        if dtype is None:
+            out[name] = values
+        else:
+            # float con None → NaN; los conteos nunca son null
+            data = np.asarray(values, dtype=np.float64).astype(dtype)
+            out[name] = {"dtype": dtype, "data": data.tobytes()}
+    return out
+
+
+def encode(payload: dict, media_type: str) -> bytes:
+    """
+    Serialize an analytics payload in the negotiated format.
+    """
+    if media_type != MSGPACK:
+        return dumps(payload)
+    body = {k: _typed(v) if k in COLUMNAR_FIELDS else v for k, v in payload.items()}
+    return msgpack.packb(body, use_bin_type=True)
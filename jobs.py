@@ -0,0 +1,105 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional
+
+from executors import run_cpu
+from operations import insert_data_from_csv
+
+# Ingestas como trabajos en segundo plano: POST /insert_data responde al
+# momento con el id del trabajo y el progreso se consulta por separado.
+
+MAX_JOBS = 50
+
+_jobs: "OrderedDict[str, dict]" = OrderedDict()
+_tasks: dict = {}
+# una ingesta a la vez; las demás quedan en cola
+_ingest_lock = asyncio.Lock()
+
+
+async def save_upload(fileobj) -> str:
+    """
+    Copy an uploaded CSV to a temporary file: the upload is closed when the request ends.
+    """
+    def copy():
+        with tempfile.NamedTemporaryFile("wb", suffix=".csv", delete=False) as out:
+            shutil.copyfileobj(fileobj, out, length=1024 * 1024)
+            return out.name
+    return await run_cpu(copy)
+
+
+def job_status(job: dict) -> dict:
+    status = {k: v for k, v in job.items() if not k.startswith("_")}
+    progress = job["progress"]
+    if job["_started"] is not None:
+        elapsed = (job["_finished"] or time.perf_counter()) - job["_started"]
+        status["elapsed_seconds"] = round(elapsed, 2)
+        status["rows_per_second"] = round(progress.get("rows_written", 0) / elapsed) if elapsed > 0 else 0
+    return status
+
+
+async def _run(job: dict, path: str, cleanup: bool, options: dict):
+    try:
+        async with _ingest_lock:
+            job["status"] = "running"
+            job["started_at"] = datetime.now(timezone.utc).isoformat()
+            job["_started"] = time.perf_counter()
+            job["result"] = await insert_data_from_csv(path, progress=job["progress"], **options)
+            job["status"] = "done"
+    except Exception as e:
+        job["status"] = "failed"
+        job["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        job["_finished"] = time.perf_counter() if job["_started"] is not None else None
+        job["finished_at"] = datetime.now(timezone.utc).isoformat()
+        _tasks.pop(job["id"], None)
+        if cleanup:
+            os.unlink(path)
+
+
+def start_ingest(path: str, source: str, cleanup: bool = False, **options) -> dict:
+    """
+    Queue an ingest of the CSV at path; cleanup deletes the file when it finishes.
+    """
+    job = {
+        "id":          uuid.uuid4().hex,
+        "status":      "queued",
+        "source":      source,
+        "options":     options,
+        "progress":    {},
+        "result":      None,
+        "error":       None,
+        "created_at":  datetime.now(timezone.utc).isoformat(),
+        "started_at":  None,
+        "finished_at": None,
+        "_started":    None,
+        "_finished":   None,
+    }
+    _jobs[job["id"]] = job
+    while len(_jobs) > MAX_JOBS:
+        oldest = next(iter(_jobs))
+        if oldest in _tasks:
+            break
+        _jobs.pop(oldest)
+    _tasks[job["id"]] = asyncio.create_task(_run(job, path, cleanup, options))
+    return job
+
+
+async def wait_job(job_id: str):
+    task = _tasks.get(job_id)
+    if task is not None:
+        await asyncio.shield(task)
+
+
+def get_job(job_id: str) -> Optional[dict]:
+    job = _jobs.get(job_id)
+    return None if job is None else job_status(job)
+
+
+def list_jobs() -> list:
+    return [job_status(job) for job in reversed(_jobs.values())]
@@ -0,0 +1,157 @@
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Awaitable, Optional
+
+from pymongo.monitoring import CommandListener
+
+from config import METRICS_ENABLED
+
+# Instrumentación: spans con nombre por etapa, cabecera Server-Timing e
+# histogramas en formato Prometheus. Con METRICS_ENABLED=0 span() devuelve un
+# contexto vacío compartido y el middleware ni siquiera se registra.
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """
+    Cumulative latency histogram per label tuple, rendered in Prometheus text format.
+    """
+
+    def __init__(self, name: str, help_text: str, label_names: tuple):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._series: dict = {}
+        # los eventos de pymongo llegan desde hilos del driver
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple, seconds: float):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(BUCKETS), 0.0, 0]
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    series[0][i] += 1
+            series[1] += seconds
+            series[2] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(labels, (list(b), s, c)) for labels, (b, s, c) in self._series.items()]
+        for labels, (buckets, total, count) in sorted(items):
+            base = ",".join(f'{k}="{v}"' for k, v in zip(self.label_names, labels))
+            sep = "," if base else ""
+            for bound, n in zip(BUCKETS, buckets):
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{bound}"}} {n}')
+            lines.append(f'{self.name}_bucket{{{base}{sep}le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{base}}} {total:.6f}")
+            lines.append(f"{self.name}_count{{{base}}} {count}")
+        return lines
+
+
+request_seconds = Histogram(
+    "http_request_duration_seconds", "Request latency per endpoint.", ("method", "route", "status"))
+stage_seconds = Histogram(
+    "stage_duration_seconds", "Latency of named stages inside a request or job.", ("stage",))
+mongo_seconds = Histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency.", ("command", "outcome"))
+
+# spans de la petición en curso (lista compartida con las tareas hijas)
+_spans: ContextVar[Optional[list]] = ContextVar("spans", default=None)
+_NOOP = nullcontext()
+
+
+@contextmanager
+def _timed(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe((name,), elapsed)
+        spans = _spans.get()
+        if spans is not None:
+            spans.append((name, elapsed))
+
+
+def span(name: str):
+    """
+    Time a block as stage `name`; a shared no-op context when metrics are disabled.
+    """
+    if not METRICS_ENABLED:
+        return _NOOP
+    return _timed(name)
+
+
+async def _timed_await(name: str, awaitable: Awaitable):
+    with _timed(name):
+        return await awaitable
+
+
+def timed(name: str, awaitable: Awaitable) -> Awaitable:
+    """
+    Wrap an awaitable (e.g. one branch of asyncio.gather) in a span.
+    """
+    if not METRICS_ENABLED:
+        return awaitable
+    return _timed_await(name, awaitable)
+
+
+def server_timing(spans: list, total: float) -> str:
+    parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in spans]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+async def metrics_middleware(request, call_next):
+    spans: list = []
+    token = _spans.set(spans)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        elapsed = time.perf_counter() - start
+        _spans.reset(token)
+        # plantilla de la ruta ("/catalogs/{catalog_type}"), no la URL: cardinalidad acotada
+        route = request.scope.get("route")
+        request_seconds.observe(
+            (request.method, getattr(route, "path", "unmatched"), str(status)), elapsed)
+    response.headers["Server-Timing"] = server_timing(spans, elapsed)
+    return response
+
+
+class CommandMonitor(CommandListener):
+    """
+    Count and time every MongoDB command sent by the driver.
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        mongo_seconds.observe((event.command_name, "ok"), event.duration_micros / 1e6)
+
+    def failed(self, event):
+        mongo_seconds.observe((event.command_name, "error"), event.duration_micros / 1e6)
+
+
+command_monitor = CommandMonitor()
+
+
+def render(gauges: dict) -> str:
+    """
+    Prometheus exposition text: the histograms plus the given gauges.
+    """
+    lines = []
+    for histogram in (request_seconds, stage_seconds, mongo_seconds):
+        lines += histogram.render()
+    for name, value in gauges.items():
+        lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+    return "\n".join(lines) + "\n"
@@ -34,15 +34,23 @@ class Restaurant(BaseModel):
     pop_detailed_total: int
     pop_generic_pos: int
     pop_generic_total: int
-    meals_list: List[str]
-    top_tags_list: List[str]
-    cuisines_list: List[str]
+    # códigos de los diccionarios de catálogo (vocabulary)
+    meals_list: List[int]
+    top_tags_list: List[int]
+    cuisines_list: List[int]
     avg_rating_cat: str
     food_cat: str
     service_cat: str
     value_cat: str
     open_days_per_week_cat: str
     price_level_cat: str
+    # campos derivados materializados en la ingesta
+    vegan: bool
+    gluten: bool
+    valid_rating: Optional[float] = None
+    price_numeric: Optional[int] = None
+    location: Optional[List[float]] = None  # [longitude, latitude]
+    content_hash: Optional[str] = None  # sha1 del contenido, para la ingesta con upsert
 
 
 class FilterParams(BaseModel):
@@ -1,45 +1,329 @@
-import pandas as pd
+import asyncio
 import csv
-from database import db
-from utils import clean_mongo_document
+import hashlib
+import math
+import time
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+from pymongo import ReplaceOne, ReturnDocument
+from database import aggregate_options, analytics_collection, db
+from utils import clean_mongo_document, content_hash, dumps
+from tiles import rebuild_cluster_tiles, tiles_ready, update_cluster_tiles
+from cache import invalidate_caches
+from dataset_stats import add_restaurants, recount_restaurants
+from columnar import reload_engine
+from spatial import reload_spatial_index
+from metrics import span, timed
+from executors import run_cpu, run_parse
+from sampling import refresh_sample
+from vocabulary import (LIST_CATALOGS, decode, decode_items, encode_records, ensure_codes, load_vocabulary,
+                        normalize_label, vocabulary_labels)
+
+DAYS = frozenset(["mon", "tue", "wed", "thu", "fri", "sat", "sun"])
 
 def group_hours(hour_str):
     if not isinstance(hour_str, str) or hour_str == "no_disponible":
         return []
-    items = [h.strip() for h in hour_str.split(",")]
     grouped = {}
     current_day = None
-    for h in items:
-        if ":" in h:
-            parts = h.split(":", 1)
-            if parts[0].lower() in ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]:
-                current_day = parts[0].lower()
-                grouped[current_day] = parts[1]
-            elif current_day:
-                grouped[current_day] += ", " + h
-    return [{"day": d, "hours": grouped[d]} for d in grouped]
-
-async def insert_data_from_csv(filepath):
-    df = pd.read_csv(filepath, quoting=csv.QUOTE_ALL, encoding="utf-8", on_bad_lines="error")
-    
-    for col in ["meals_list", "top_tags_list", "cuisines_list"]:
-        df[col] = df[col].apply(lambda x: x.split(",") if isinstance(x, str) and x != "no_disponible" else [])
-
-    df["original_open_hours"] = df["original_open_hours"].apply(group_hours)
+    for h in hour_str.split(","):
+        h = h.strip()
+        sep = h.find(":")
+        if sep < 0:
+            continue
+        day = h[:sep].lower()
+        if day in DAYS:
+            current_day = day
+            grouped[day] = h[sep + 1:]
+        elif current_day:
+            grouped[current_day] += ", " + h
+    return [{"day": d, "hours": v} for d, v in grouped.items()]
+
+# Campos derivados que usan los pipelines de analytics
+PRICE_NUMERIC = {"barato": 1, "regular": 2, "caro": 3}
+
+DERIVED_FIELDS_EXPR = {
+    "vegan":         {"$eq":[{"$toLower":{"$toString":"$vegan_options"}}, "si"]},
+    "gluten":        {"$eq":[{"$toLower":{"$toString":"$gluten_free"}},   "si"]},
+    "valid_rating":  {"$cond":[
+                         {"$and":[
+                             {"$ne":["$avg_rating", None]},
+                             {"$isNumber":"$avg_rating"},
+                             {"$gt":["$avg_rating",   0]},
+                             {"$lte":["$avg_rating",   5]}
+                         ]},
+                         "$avg_rating",
+                         None
+                     ]},
+    "location":      {"$cond":[
+                         {"$and":[
+                             {"$gte":["$longitude", -180]}, {"$lte":["$longitude", 180]},
+                             {"$gte":["$latitude",   -90]}, {"$lte":["$latitude",   90]}
+                         ]},
+                         ["$longitude", "$latitude"],
+                         None
+                     ]},
+    "price_numeric": {"$switch":{
+                         "branches":[
+                             {"case":{"$eq":[{"$toLower":{"$toString":"$price_level_cat"}}, name]}, "then":num}
+                             for name, num in PRICE_NUMERIC.items()
+                         ],
+                         "default": None
+                     }}
+}
+
+def _lower_str(series):
+    return series.where(series.notna(), "").astype(str).str.lower()
+
+def add_derived_fields(df):
+    """
+    Calcula una sola vez vegan/gluten (bool), valid_rating (float o None),
+    price_numeric (int o None) y location ([lon, lat] o None),
+    equivalentes a DERIVED_FIELDS_EXPR.
+    """
+    df["vegan"]  = _lower_str(df["vegan_options"]) == "si"
+    df["gluten"] = _lower_str(df["gluten_free"]) == "si"
+
+    # columnas object construidas a mano: pandas convertiría None en NaN
+    rating = pd.to_numeric(df["avg_rating"], errors="coerce")
+    rating = rating.where((rating > 0) & (rating <= 5))
+    df["valid_rating"] = pd.Series(
+        [None if pd.isna(v) else float(v) for v in rating], index=df.index, dtype=object
+    )
+
+    price = _lower_str(df["price_level_cat"]).map(PRICE_NUMERIC)
+    df["price_numeric"] = pd.Series(
+        [None if pd.isna(v) else int(v) for v in price], index=df.index, dtype=object
+    )
+
+    # par [longitude, latitude] para el índice 2d
+    lat = pd.to_numeric(df["latitude"], errors="coerce")
+    lon = pd.to_numeric(df["longitude"], errors="coerce")
+    valid = lat.between(-90, 90) & lon.between(-180, 180)
+    df["location"] = [[x, y] if ok else None for x, y, ok in zip(lon, lat, valid)]
+    return df
+
+# documentos insertados antes de materializar los campos derivados
+LEGACY_DERIVED = {"$or": [{"price_numeric": {"$exists": False}}, {"location": {"$exists": False}}]}
+
+async def backfill_derived_fields():
+    # Migración: documentos insertados antes de materializar los campos derivados
+    result = await db["restaurants"].update_many(LEGACY_DERIVED, [{"$set": DERIVED_FIELDS_EXPR}])
+    invalidate_caches()
+    return {"message": "Campos derivados actualizados", "modified": result.modified_count}
+
+async def migrate_derived_fields():
+    """
+    Se ejecuta al arrancar: el $geoWithin sobre location y las sumas de
+    vegan/valid_rating excluirían sin avisar los documentos antiguos, así
+    que el backfill no depende de que alguien llame a /migrations/derived_fields.
+    """
+    if not await db["restaurants"].find_one(LEGACY_DERIVED, {"_id": 1}):
+        return 0
+    with span("derived_backfill"):
+        modified = (await backfill_derived_fields())["modified"]
+    # la pirámide y la muestra se calcularon sin esos documentos
+    if modified:
+        if await tiles_ready():
+            await rebuild_cluster_tiles()
+        await refresh_sample()
+    return modified
+
+LIST_COLUMNS = ["meals_list", "top_tags_list", "cuisines_list"]
+
+def split_list(value):
+    # etiquetas sin espacios ni duplicados: " Lunch" y "Lunch" son la misma comida
+    if not isinstance(value, str) or value == "no_disponible":
+        return []
+    return list(dict.fromkeys(v for v in map(normalize_label, value.split(",")) if v))
+
+def parse_unique(series, parse):
+    """
+    Aplica parse una sola vez por valor distinto de la columna y reparte el
+    resultado con factorize: horarios y listas se repiten mucho entre
+    restaurantes. Las filas iguales comparten el objeto resultante.
+    """
+    codes, uniques = pd.factorize(series)
+    # el último hueco (código -1) es el resultado para NaN
+    parsed = np.empty(len(uniques) + 1, dtype=object)
+    for i, value in enumerate(uniques):
+        parsed[i] = parse(value)
+    parsed[-1] = parse(None)
+    return pd.Series(parsed[codes], index=series.index, dtype=object)
+
+def split_list_column(series):
+    return parse_unique(series, split_list)
+
+def parse_hours_column(series):
+    return parse_unique(series, group_hours)
+
+def prepare_records(df):
+    # Convierte un bloque del CSV en documentos listos para insertar
+    for col in LIST_COLUMNS:
+        df[col] = split_list_column(df[col])
+
+    df["original_open_hours"] = parse_hours_column(df["original_open_hours"])
+    df = add_derived_fields(df)
     records = df.to_dict(orient="records")
-    await db["restaurants"].insert_many(records)
-    return {"message": "Datos insertados correctamente"}
+    # huella del contenido: la ingesta con upsert salta los documentos sin cambios
+    for rec in records:
+        rec["content_hash"] = content_hash(rec)
+    return records
+
+# campos del documento anterior necesarios para descontarlo de la pirámide de clusters
+TILE_FIELDS = {"_id": 0, "restaurant_link": 1, "content_hash": 1, "country": 1, "location": 1,
+               "vegan": 1, "gluten": 1, "valid_rating": 1, "price_numeric": 1}
+
+async def upsert_records(records):
+    """
+    Upsert por restaurant_link con un bulk_write unordered. Solo se reescriben
+    los documentos nuevos o cuyo content_hash ha cambiado; los cambiados se
+    restan de la pirámide antes de sumar la versión nueva.
+    """
+    # dentro de un lote gana la última fila de cada restaurant_link
+    by_link = {rec["restaurant_link"]: rec for rec in records}
+    existing = {
+        doc["restaurant_link"]: doc
+        async for doc in db["restaurants"].find({"restaurant_link": {"$in": list(by_link)}}, TILE_FIELDS)
+    }
+    changed = [rec for link, rec in by_link.items()
+               if link not in existing or existing[link].get("content_hash") != rec["content_hash"]]
+    # filas repetidas del lote: solo cuenta la última de cada restaurant_link
+    counts = {"inserted": 0, "updated": 0, "unchanged": len(by_link) - len(changed),
+              "duplicates": len(records) - len(by_link)}
+    if not changed:
+        return counts
+
+    result = await db["restaurants"].bulk_write(
+        [ReplaceOne({"restaurant_link": rec["restaurant_link"]}, rec, upsert=True) for rec in changed],
+        ordered=False,
+    )
+    counts["inserted"] = result.upserted_count
+    counts["updated"] = len(changed) - result.upserted_count
+    await add_restaurants(result.upserted_count)
+    await timed("ingest_catalogs", merge_catalogs(changed))
+    previous = [existing[rec["restaurant_link"]] for rec in changed if rec["restaurant_link"] in existing]
+    await timed("ingest_tiles", update_cluster_tiles(changed, removed=previous))
+    return counts
+
+async def insert_data_from_csv(filepath, chunksize=50_000, max_inflight=4, upsert=False, progress=None):
+    """
+    Ingesta por bloques: lee chunksize filas cada vez fuera del event loop y
+    mantiene como máximo max_inflight lotes (parseo + insert_many unordered)
+    en curso, así la memoria no crece con el tamaño del fichero. Con
+    upsert=True la ingesta es idempotente: upsert por restaurant_link (ver
+    upsert_records). Si se pasa progress (dict), se actualiza en vivo con
+    rows_read, rows_written y los contadores.
+    """
+    start = time.perf_counter()
+    reader = await run_cpu(
+        pd.read_csv, filepath, quoting=csv.QUOTE_ALL, encoding="utf-8",
+        on_bad_lines="error", chunksize=chunksize,
+    )
+    slots = asyncio.Semaphore(max_inflight)
+    tasks = []
+    total = 0
+    counts = progress if progress is not None else {}
+    counts.update({"rows_read": 0, "rows_written": 0, "inserted": 0, "updated": 0, "unchanged": 0, "duplicates": 0})
+    # lotes en curso que comparten restaurant_link no se escriben a la vez: los
+    # dos verían el enlace como nuevo y lo insertarían dos veces
+    busy_links: set = set()
+    links_free = asyncio.Condition()
+    # tras un fallo (lectura o lote) no se leen más bloques ni empieza ninguna escritura
+    failed = asyncio.Event()
+    # lotes que aún no escriben: se pueden cancelar sin dejar nada a medias
+    parsing: set = set()
+
+    async def insert_batch(chunk):
+        parsing.add(asyncio.current_task())
+        try:
+            # el parseo (pandas + horarios) va al pool de CPU o de procesos
+            with span("ingest_parse"):
+                records = await run_parse(prepare_records, chunk)
+            parsing.discard(asyncio.current_task())
+            if failed.is_set():
+                return
+            await write_batch(records)
+            counts["rows_written"] += len(records)
+        except BaseException:
+            failed.set()
+            raise
+        finally:
+            parsing.discard(asyncio.current_task())
+            slots.release()
+
+    async def write_batch(records):
+        # listas → códigos del diccionario (vocabulary), después del parseo
+        await timed("ingest_encode", encode_records(records))
+        if upsert:
+            links = {rec["restaurant_link"] for rec in records}
+            async with links_free:
+                await links_free.wait_for(lambda: busy_links.isdisjoint(links))
+                busy_links.update(links)
+            try:
+                batch = await timed("ingest_upsert", upsert_records(records))
+            finally:
+                async with links_free:
+                    busy_links.difference_update(links)
+                    links_free.notify_all()
+            for key, value in batch.items():
+                counts[key] += value
+            return
+        result = await timed("ingest_insert", db["restaurants"].insert_many(records, ordered=False))
+        counts["inserted"] += len(result.inserted_ids)
+        await add_restaurants(len(result.inserted_ids))
+        await timed("ingest_catalogs", merge_catalogs(records))
+        await timed("ingest_tiles", update_cluster_tiles(records))
+
+    try:
+        while True:
+            await slots.acquire()
+            if failed.is_set():
+                slots.release()
+                break
+            with span("ingest_read"):
+                chunk = await run_cpu(next, reader, None)
+            if chunk is None:
+                slots.release()
+                break
+            total += len(chunk)
+            counts["rows_read"] = total
+            tasks.append(asyncio.create_task(insert_batch(chunk)))
+        await asyncio.gather(*tasks)
+    except BaseException:
+        failed.set()
+        raise
+    finally:
+        # los lotes pendientes se cancelan y los que ya escriben se esperan:
+        # ninguno sigue escribiendo cuando se libera _ingest_lock
+        for task in list(parsing):
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        reader.close()
+        invalidate_caches()
+        # también tras un fallo: las filas ya escritas deben verse en los
+        # resúmenes e índices. Una re-ingesta sin cambios no los invalida
+        if counts["inserted"] or counts["updated"]:
+            with span("ingest_summaries"):
+                await rebuild_summaries()
+            with span("ingest_reload"):
+                await reload_engine()
+                await reload_spatial_index()
+                await refresh_sample()
+    elapsed = time.perf_counter() - start
+    return {
+        "message": "Datos insertados correctamente",
+        "rows": total,
+        **{k: counts[k] for k in ("inserted", "updated", "unchanged", "duplicates")},
+        "seconds": round(elapsed, 2),
+        "rows_per_second": round(total / elapsed) if elapsed > 0 else total,
+    }
 
 async def get_open_hours(limit=100):
     return await db["restaurants"].find({}, {"original_open_hours": 1, "_id": 0}).to_list(limit)
 async def rebuild_catalogs():
-    catalogs = db["catalogs"]
-    # 1) Si existe, la borramos
-    if "catalogs" in await db.list_collection_names():
-        await catalogs.drop()
-
-    # 2) Creamos de nuevo los tres catálogos
-    # — Locations (país→provincias→ciudades)
+    # 1) Locations (país→provincias→ciudades) desde cero
     pipeline = [
         {"$group": {
             "_id": {"country": "$country", "province": "$province", "city": "$city"}
@@ -57,32 +341,318 @@ async def rebuild_catalogs():
         }},
         {"$project": {"_id": 0, "nombre": "$_id", "provincias": 1}}
     ]
-    locs = await db["restaurants"].aggregate(pipeline).to_list(length=None)
+    with span("catalog_locations"):
+        locs = await db["restaurants"].aggregate(pipeline, **aggregate_options(max_time=False)).to_list(length=None)
 
-    # — Flat catalogs
-    cuisines = await db["restaurants"].distinct("cuisines_list")
-    meals    = await db["restaurants"].distinct("meals_list")
+    # 2) Cocinas, comidas y etiquetas son los diccionarios de códigos: solo
+    #    crecen (no se reconstruyen); se codifican las listas aún en texto
+    with span("catalog_encode"):
+        migrated = await encode_list_fields()
 
-    await catalogs.insert_many([
-        {"tipo": "locations", "items": locs},
-        {"tipo": "cuisines",  "items": cuisines},
-        {"tipo": "meals",     "items": meals},
-    ])
+    # 3) Un único documento: replace_one es atómico, /catalogs nunca ve un catálogo a medias
+    version = time.time_ns() // 1_000_000
+    async with _catalog_lock:
+        with span("catalog_swap"):
+            await db["catalogs"].replace_one(
+                {"tipo": "locations"}, {"tipo": "locations", "items": locs, "version": version}, upsert=True
+            )
+        # 4) Los diccionarios conservan sus códigos; se guarda cuáles aparecen en
+        #    los datos y /catalogs/{tipo} sirve solo esas etiquetas
+        with span("catalog_present"):
+            for field, tipo in LIST_CATALOGS.items():
+                codes = await db["restaurants"].distinct(field)
+                await db["catalogs"].update_one(
+                    {"tipo": tipo},
+                    {"$set": {"present": sorted(c for c in codes if isinstance(c, int))}, "$inc": {"version": 1}},
+                )
+        invalidate_catalog_cache()
+
+    # los resúmenes, el motor columnar y la muestra agrupan por código
+    if migrated:
+        await rebuild_summaries()
+        await reload_engine()
+        await refresh_sample()
+    await recount_restaurants()
+    invalidate_caches()
+    return {"message": "Catálogos reconstruidos correctamente.", "encoded_documents": migrated}
+
+
+async def encode_list_fields():
+    """
+    Migración: listas guardadas como texto (anteriores a la codificación por
+    diccionario) → códigos, normalizando las etiquetas y quitando duplicados.
+    """
+    modified = 0
+    for field in LIST_CATALOGS:
+        legacy = {field: {"$type": "string"}}
+        values = await db["restaurants"].distinct(field, legacy)
+        await ensure_codes(field, {normalize_label(v) for v in values if isinstance(v, str)} - {""})
+        labels = {"$literal": vocabulary_labels(field)}
+        codes = {"$map": {"input": f"${field}", "in": {"$cond": [
+            {"$isNumber": "$$this"},
+            "$$this",
+            {"$indexOfArray": [labels, {"$trim": {"input": "$$this"}}]},
+        ]}}}
+        result = await db["restaurants"].update_many(legacy, [{"$set": {field: {"$reduce": {
+            "input":        codes,
+            "initialValue": [],
+            # -1: etiqueta vacía; un código repetido se queda una sola vez
+            "in": {"$cond": [
+                {"$or": [{"$lt": ["$$this", 0]}, {"$in": ["$$this", "$$value"]}]},
+                "$$value",
+                {"$concatArrays": ["$$value", ["$$this"]]},
+            ]},
+        }}}}])
+        modified += result.modified_count
+    return modified
+
+
+async def migrate_list_fields():
+    """
+    Se ejecuta al arrancar: los filtros por código excluirían sin avisar los
+    documentos con listas aún en texto, así que la migración no depende de
+    que alguien llame a /catalogs/build.
+    """
+    legacy = {"$or": [{field: {"$type": "string"}} for field in LIST_CATALOGS]}
+    if not await db["restaurants"].find_one(legacy, {"_id": 1}):
+        return 0
+    with span("catalog_encode"):
+        migrated = await encode_list_fields()
+    if migrated:
+        await rebuild_summaries()
+        await refresh_sample()
+        invalidate_caches()
+    return migrated
+
+
+_catalog_lock = asyncio.Lock()
+
+def _catalog_value(value):
+    # NaN no es igual a sí mismo: lo tratamos como None para comparar
+    return None if isinstance(value, float) and math.isnan(value) else value
+
+def merge_locations(items: list, additions: dict) -> bool:
+    """
+    Añade al árbol país→provincias→ciudades del catálogo las ramas nuevas de
+    additions ({país: {provincia: {ciudades}}}). Devuelve si hubo cambios.
+    """
+    changed = False
+    by_country = {_catalog_value(c["nombre"]): c for c in items}
+    for country, provinces in additions.items():
+        entry = by_country.get(country)
+        if entry is None:
+            entry = by_country[country] = {"nombre": country, "provincias": []}
+            items.append(entry)
+            changed = True
+        by_province = {_catalog_value(p["nombre"]): p for p in entry["provincias"]}
+        for province, cities in provinces.items():
+            prov = by_province.get(province)
+            if prov is None:
+                prov = by_province[province] = {"nombre": province, "ciudades": []}
+                entry["provincias"].append(prov)
+                changed = True
+            known = {_catalog_value(c) for c in prov["ciudades"]}
+            new_cities = [c for c in cities if c not in known]
+            if new_cities:
+                prov["ciudades"].extend(new_cities)
+                changed = True
+    return changed
+
+async def merge_catalogs(records: list):
+    """
+    Mantenimiento incremental: fusiona en el catálogo de ubicaciones los
+    países, provincias y ciudades de un lote recién insertado (cocinas,
+    comidas y etiquetas ya se añadieron al codificar el lote; aquí solo se
+    marcan como presentes sus códigos).
+    """
+    additions: dict = {}
+    for rec in records:
+        country = _catalog_value(rec.get("country"))
+        province = _catalog_value(rec.get("province"))
+        additions.setdefault(country, {}).setdefault(province, set()).add(_catalog_value(rec.get("city")))
+
+    catalogs = db["catalogs"]
+    async with _catalog_lock:
+        doc = await catalogs.find_one({"tipo": "locations"}, {"_id": 0, "items": 1})
+        items = doc["items"] if doc else []
+        if merge_locations(items, additions):
+            await catalogs.update_one(
+                {"tipo": "locations"}, {"$set": {"items": items}, "$inc": {"version": 1}}, upsert=True
+            )
+        for field, tipo in LIST_CATALOGS.items():
+            codes = sorted({code for rec in records for code in rec.get(field) or ()})
+            if codes:
+                # sin "present" (nunca reconstruido) se sirven todas las etiquetas
+                await catalogs.update_one(
+                    {"tipo": tipo, "present": {"$exists": True, "$not": {"$all": codes}}},
+                    {"$addToSet": {"present": {"$each": codes}}, "$inc": {"version": 1}},
+                )
+        invalidate_catalog_cache()
+
+
+# ————————————————
+# Caché de catálogos serializados (ETag = versión)
+# ————————————————
 
-    return {"message": "Catálogos reconstruidos correctamente."}
+CATALOG_REFRESH_SECONDS = 30
+CATALOG_MAX_AGE = 60
 
+# tipo (o "*" para el listado) → {"version", "etag", "body", "checked_at"}
+_catalog_cache: dict = {}
 
-async def get_catalog(catalog_type: str):
-    doc = await db["catalogs"].find_one({"tipo": catalog_type}, {"_id": 0})
-    if not doc:
+def invalidate_catalog_cache():
+    _catalog_cache.clear()
+
+def catalog_items(doc: dict) -> list:
+    """
+    Items servidos de un catálogo: de un diccionario de códigos con
+    "present" solo las etiquetas que aparecen en los datos, en orden de código.
+    """
+    items = doc.get("items") or []
+    present = doc.pop("present", None)
+    if present is None:
+        return items
+    return [items[code] for code in sorted(set(present)) if 0 <= code < len(items)]
+
+async def _catalog_versions() -> dict:
+    heads = await db["catalogs"].find({}, {"_id": 0, "tipo": 1, "version": 1}).to_list(length=None)
+    return {h["tipo"]: h.get("version", 0) for h in heads}
+
+async def cached_catalog(catalog_type: str):
+    """
+    Bytes JSON de los items de un catálogo (o de todo el listado con "*").
+    Tras CATALOG_REFRESH_SECONDS solo se consulta la versión y se vuelve a
+    leer el catálogo completo únicamente si ha cambiado.
+    """
+    entry = _catalog_cache.get(catalog_type)
+    now = time.monotonic()
+    if entry and now - entry["checked_at"] < CATALOG_REFRESH_SECONDS:
+        return entry
+
+    versions = await _catalog_versions()
+    if catalog_type == "*":
+        version = ",".join(f"{t}:{v}" for t, v in sorted(versions.items()))
+    elif catalog_type in versions:
+        version = str(versions[catalog_type])
+    else:
+        _catalog_cache.pop(catalog_type, None)
         return None
-    # limpia recursivamente floats nan/inf
-    
-    print(doc)
-    return clean_mongo_document(doc)
 
+    if entry and entry["version"] == version:
+        entry["checked_at"] = now
+        return entry
+
+    # dumps limpia NaN/ObjectId al serializar: sin pasar por clean_mongo_document
+    projection = {"_id": 0, "version": 0, "encoded": 0}
+    if catalog_type == "*":
+        with span("catalog_read"):
+            raw = await db["catalogs"].find({}, projection).to_list(length=None)
+        for doc in raw:
+            doc["items"] = catalog_items(doc)
+        with span("serialize"):
+            body = await run_cpu(dumps, {"catalogs": raw})
+    else:
+        with span("catalog_read"):
+            doc = await db["catalogs"].find_one({"tipo": catalog_type}, projection)
+        if not doc:
+            return None
+        with span("serialize"):
+            body = await run_cpu(dumps, catalog_items(doc))
+    digest = hashlib.sha1(version.encode()).hexdigest()[:16]
+    entry = {"version": version, "etag": f'"{digest}"', "body": body, "checked_at": now}
+    _catalog_cache[catalog_type] = entry
+    return entry
+
+
+# ————————————————
+# Resúmenes globales precalculados
+# ————————————————
 
-async def list_catalogs():
-    raw = await db["catalogs"].find({}, {"_id": 0}).to_list(length=None)
-    # limpia cada documento completo
-    return [clean_mongo_document(doc) for doc in raw]
\ No newline at end of file
+SUMMARY_PIPELINES = {
+    "restaurants_by_country": [
+        {"$group": {"_id": "$country", "count": {"$sum": 1}}},
+        {"$sort": {"count": -1}}
+    ],
+    "top_tags_by_country": [
+        {"$unwind": "$top_tags_list"},
+        {"$group": {"_id": {"country": "$country", "tag": "$top_tags_list"}, "count": {"$sum": 1}}},
+        {"$sort": {"count": -1}},
+        {"$group": {"_id": "$_id.country", "top_tags": {"$push": {"tag": "$_id.tag", "count": "$count"}}}},
+        {"$project": {"top_tags": {"$slice": ["$top_tags", 5]}}}
+    ],
+    "top_cuisines_by_country": [
+        {"$unwind": "$cuisines_list"},
+        {"$group": {"_id": {"country": "$country", "cuisine": "$cuisines_list"}, "count": {"$sum": 1}}},
+        {"$sort": {"count": -1}},
+        {"$group": {"_id": "$_id.country", "top_cuisines": {"$push": {"cuisine": "$_id.cuisine", "count": "$count"}}}},
+        {"$project": {"top_cuisines": {"$slice": ["$top_cuisines", 5]}}}
+    ],
+    "avg_rating_by_cuisine": [
+        {"$match": {"avg_rating": {"$ne": 0}}},  # excluye los nulos
+        {"$unwind": "$cuisines_list"},
+        {"$group": {"_id": "$cuisines_list", "avg_rating": {"$avg": "$avg_rating"}}},
+        {"$sort": {"avg_rating": -1}}
+    ],
+}
+
+def decode_summary(tipo: str, items: list) -> list:
+    # los pipelines agrupan por código: las etiquetas se ponen al guardar
+    for item in items:
+        if tipo == "top_tags_by_country":
+            decode_items("top_tags_list", item["top_tags"], "tag")
+        elif tipo == "top_cuisines_by_country":
+            decode_items("cuisines_list", item["top_cuisines"], "cuisine")
+        elif tipo == "avg_rating_by_cuisine":
+            item["_id"] = decode("cuisines_list", item["_id"])
+    return items
+
+SUMMARY_REFRESH_SECONDS = 300
+
+# tipo → {"tipo", "items", "version", "built_at"} y cuándo se leyó de Mongo
+_summaries: dict = {}
+_summaries_loaded_at: dict = {}
+
+async def rebuild_summaries():
+    summaries = db["summaries"]
+    results = await asyncio.gather(*(
+        analytics_collection.aggregate(pipeline, **aggregate_options(max_time=False)).to_list(length=None)
+        for pipeline in SUMMARY_PIPELINES.values()
+    ))
+    built_at = datetime.now(timezone.utc)
+    # los resúmenes guardan etiquetas: códigos añadidos por otro proceso deben decodificarse
+    await load_vocabulary(force=True)
+    # limpieza de NaN/ObjectId y etiquetas fuera del event loop
+    results = await run_cpu(lambda: [
+        decode_summary(tipo, [clean_mongo_document(i) for i in items])
+        for tipo, items in zip(SUMMARY_PIPELINES, results)
+    ])
+    for tipo, items in zip(SUMMARY_PIPELINES, results):
+        doc = await summaries.find_one_and_update(
+            {"tipo": tipo},
+            {"$set": {"items": items, "built_at": built_at},
+             "$inc": {"version": 1}},
+            projection={"_id": 0},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        _summaries[tipo] = doc
+        _summaries_loaded_at[tipo] = time.monotonic()
+    return {"message": "Resúmenes reconstruidos correctamente.", "built_at": built_at.isoformat()}
+
+async def get_summary(tipo: str):
+    """
+    Resumen precalculado desde memoria; se relee de la colección cada
+    SUMMARY_REFRESH_SECONDS y se construye si todavía no existe.
+    """
+    if tipo not in SUMMARY_PIPELINES:
+        return None
+    loaded_at = _summaries_loaded_at.get(tipo)
+    if loaded_at is not None and time.monotonic() - loaded_at < SUMMARY_REFRESH_SECONDS:
+        return _summaries[tipo]
+    doc = await db["summaries"].find_one({"tipo": tipo}, {"_id": 0})
+    if doc is None:
+        await rebuild_summaries()
+        return _summaries[tipo]
+    _summaries[tipo] = doc
+    _summaries_loaded_at[tipo] = time.monotonic()
+    return doc
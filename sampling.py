@@ -0,0 +1,189 @@
+import math
+from datetime import datetime, timezone
+from typing import Optional
+
+from pymongo import ASCENDING, GEO2D
+
+from cache import invalidate_caches
+from config import SAMPLE_MIN_PER_STRATUM, SAMPLE_SIZE
+from database import aggregate_options, collection, db
+
+# Muestra estratificada por país para las analíticas aproximadas de zoom bajo.
+# Cada documento lleva su peso w = N_h / n_h (inverso de la probabilidad de
+# inclusión) y w(w-1) para estimar la varianza (Horvitz-Thompson).
+sample = db["restaurants_sample"]
+
+APPROX_MAX_ZOOM = 6
+Z95 = 1.96
+META_ID = "sample"
+
+SAMPLE_FIELDS = {
+    f: 1 for f in ("country", "province", "city", "claimed", "price_level_cat", "latitude", "longitude",
+                   "service", "food", "meals_list", "top_tags_list", "cuisines_list",
+                   "vegan", "gluten", "valid_rating", "price_numeric", "location")
+}
+
+_ready: Optional[bool] = None
+
+
+async def sample_ready() -> bool:
+    global _ready
+    if _ready is None:
+        _ready = await db["dataset_stats"].count_documents({"_id": META_ID}, limit=1) > 0
+    return _ready
+
+
+async def rebuild_sample():
+    """
+    Draw n_h = SAMPLE_SIZE * N_h / N restaurants per country (at least
+    SAMPLE_MIN_PER_STRATUM, at most N_h) with $sample and swap the collection in.
+    """
+    global _ready
+    strata = await collection.aggregate(
+        [{"$group": {"_id": "$country", "n": {"$sum": 1}}}], **aggregate_options(max_time=False)
+    ).to_list(length=None)
+    population = sum(s["n"] for s in strata)
+    building = db["restaurants_sample_building"]
+    await building.drop()
+    drawn = 0
+    for stratum in strata:
+        size = min(stratum["n"], max(SAMPLE_MIN_PER_STRATUM, round(SAMPLE_SIZE * stratum["n"] / population)))
+        weight = stratum["n"] / size
+        await collection.aggregate([
+            {"$match": {"country": stratum["_id"]}},
+            {"$sample": {"size": size}},
+            {"$project": SAMPLE_FIELDS},
+            {"$addFields": {"sample_weight": weight, "sample_wv": weight * (weight - 1)}},
+            {"$merge": {"into": building.name, "whenMatched": "keepExisting"}},
+        ], **aggregate_options(max_time=False)).to_list(length=None)
+        drawn += size
+
+    if drawn:
+        await building.create_index([("location", GEO2D)], min=-180, max=181)
+        await building.create_index([("latitude", ASCENDING), ("longitude", ASCENDING)])
+        await building.rename(sample.name, dropTarget=True)
+    await db["dataset_stats"].replace_one(
+        {"_id": META_ID},
+        {"_id": META_ID, "size": drawn, "population": population, "strata": len(strata),
+         "built_at": datetime.now(timezone.utc)},
+        upsert=True,
+    )
+    _ready = drawn > 0
+    invalidate_caches()
+    return {"message": "Muestra reconstruida", "size": drawn, "population": population, "strata": len(strata)}
+
+
+async def refresh_sample():
+    """
+    Redraw the sample after the data changed, only on deployments that built
+    one (POST /sample/build); the first build is never implicit.
+    """
+    if await sample_ready():
+        await rebuild_sample()
+
+
+def _weighted(expr) -> dict:
+    return {"$sum": {"$multiply": ["$sample_weight", expr]}}
+
+
+def _variance(expr) -> dict:
+    return {"$sum": {"$multiply": ["$sample_wv", expr]}}
+
+
+def weighted_stats_facet() -> list:
+    """
+    Weighted sums of the stats facet plus the w(w-1) terms of their variances.
+    """
+    vegan = {"$cond": ["$vegan", 1, 0]}
+    gluten = {"$cond": ["$gluten", 1, 0]}
+    premium = {"$cond": [{"$eq": ["$price_numeric", 3]}, 1, 0]}
+    rated = {"$cond": [{"$ne": ["$valid_rating", None]}, 1, 0]}
+    rating = {"$ifNull": ["$valid_rating", 0]}
+    priced = {"$cond": [{"$ne": ["$price_numeric", None]}, 1, 0]}
+    return [
+        {"$group": {
+            "_id": None,
+            "sample_hits":       {"$sum": 1},
+            "total":             {"$sum": "$sample_weight"},
+            "vegan_count":       _weighted(vegan),
+            "gluten_free_count": _weighted(gluten),
+            "premium_count":     _weighted(premium),
+            "rating_sum":        _weighted(rating),
+            "rating_count":      _weighted(rated),
+            "price_sum":         _weighted({"$ifNull": ["$price_numeric", 0]}),
+            "price_count":       _weighted(priced),
+            "v_total":           {"$sum": "$sample_wv"},
+            "v_vegan":           _variance(vegan),
+            "v_gluten":          _variance(gluten),
+            "v_premium":         _variance(premium),
+            "v_rated":           _variance(rated),
+            "v_rating":          _variance(rating),
+            "v_rating2":         _variance({"$multiply": [rating, rating]}),
+        }}
+    ]
+
+
+def weighted_distribution_facet(field: str, label: str) -> list:
+    return [
+        {"$unwind": f"${field}"},
+        {"$group": {"_id": f"${field}", "count": {"$sum": "$sample_weight"}, "v": {"$sum": "$sample_wv"}}},
+        {"$project": {"_id": 0, label: "$_id", "count": 1, "v": 1}},
+    ]
+
+
+def _share_error(part: float, v_part: float, total: float, v_total: float) -> float:
+    # error de un cociente part/total linealizado: Σ w(w-1)(y - p)² con y binaria
+    p = part / total
+    return Z95 * math.sqrt(max(0.0, v_part * (1 - 2 * p) + p * p * v_total)) / total
+
+
+def estimate(doc: Optional[dict]) -> tuple:
+    """
+    (stats doc for build_overall_stats, 95 % error bounds in the units of overall_stats).
+    """
+    if not doc or doc["total"] <= 0:
+        return None, {"sample_hits": 0}
+    total = doc["total"]
+    errors = {
+        "sample_hits":       doc["sample_hits"],
+        "total_restaurants": round(Z95 * math.sqrt(doc["v_total"])),
+        "pct_vegan":         round(100 * _share_error(doc["vegan_count"], doc["v_vegan"], total, doc["v_total"]), 2),
+        "pct_gluten_free":   round(100 * _share_error(doc["gluten_free_count"], doc["v_gluten"], total, doc["v_total"]), 2),
+        "pct_premium":       round(100 * _share_error(doc["premium_count"], doc["v_premium"], total, doc["v_total"]), 2),
+    }
+    if doc["rating_count"] > 0:
+        r = doc["rating_sum"] / doc["rating_count"]
+        var = doc["v_rating2"] - 2 * r * doc["v_rating"] + r * r * doc["v_rated"]
+        errors["avg_rating"] = round(Z95 * math.sqrt(max(0.0, var)) / doc["rating_count"], 2)
+    stats_doc = {k: round(doc[k]) if k.endswith("_count") or k == "total" else doc[k]
+                 for k in ("total", "vegan_count", "gluten_free_count", "premium_count",
+                           "rating_sum", "rating_count", "price_sum", "price_count")}
+    return stats_doc, errors
+
+
+def estimate_distribution(items: list, label: str) -> list:
+    out = [{label: i[label], "count": round(i["count"]), "error": round(Z95 * math.sqrt(i["v"]))}
+           for i in items]
+    return sorted(out, key=lambda i: -i["count"])
+
+
+async def sample_facets(match_stage: dict) -> dict:
+    """
+    Estimated stats and meal/tag distributions of match_stage from the sample.
+    """
+    facets = {
+        "stats":         weighted_stats_facet(),
+        "meals_list":    weighted_distribution_facet("meals_list", "meal"),
+        "top_tags_list": weighted_distribution_facet("top_tags_list", "tag"),
+    }
+    res = await sample.aggregate(
+        [{"$match": match_stage}, {"$facet": facets}], **aggregate_options()
+    ).to_list(length=1)
+    res = res[0] if res else {}
+    stats_doc, errors = estimate((res.get("stats") or [None])[0])
+    return {
+        "stats":         [stats_doc] if stats_doc else [],
+        "meals_list":    estimate_distribution(res.get("meals_list", []), "meal"),
+        "top_tags_list": estimate_distribution(res.get("top_tags_list", []), "tag"),
+        "approx":        {"confidence": 0.95, "errors": errors},
+    }
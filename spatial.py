@@ -0,0 +1,134 @@
+import asyncio
+from typing import Optional
+
+import numpy as np
+from bson import ObjectId
+
+from cache import invalidate_caches
+from config import SPATIAL_CELL_ZOOM, SPATIAL_INDEX, SPATIAL_MAX_CANDIDATES
+from database import collection
+from executors import run_cpu
+from tiles import cluster_cell_size
+
+# Índice espacial en proceso: rejilla uniforme (misma fórmula de cell_size que
+# los clusters) con los puntos ordenados por celda, para resolver un bbox en
+# _ids candidatos sin tocar MongoDB.
+
+# columnas de celdas interiores contadas por tanda antes de descartar el índice
+INSIDE_COLUMNS_BATCH = 32
+
+
+def lon_ranges(east: float, west: float) -> list:
+    """
+    Longitude intervals of a viewport; two when it crosses the antimeridian (west > east).
+    """
+    if west > east:
+        return [(west, 180.0), (-180.0, east)]
+    return [(west, east)]
+
+
+class GridIndex:
+
+    def __init__(self, cell_size: float):
+        self.cell_size = cell_size
+        self.nx = int(np.floor(360 / cell_size)) + 1
+        self.ny = int(np.floor(180 / cell_size)) + 1
+        self.loaded = False
+        self.size = 0
+        self._lock = asyncio.Lock()
+
+    def _cell_xy(self, lat, lon):
+        cx = np.clip(np.floor((np.asarray(lon) + 180) / self.cell_size).astype(np.int64), 0, self.nx - 1)
+        cy = np.clip(np.floor((np.asarray(lat) + 90) / self.cell_size).astype(np.int64), 0, self.ny - 1)
+        return cx, cy
+
+    def build(self, lat: np.ndarray, lon: np.ndarray, ids: np.ndarray):
+        cx, cy = self._cell_xy(lat, lon)
+        cells = cx * self.ny + cy
+        order = np.argsort(cells, kind="stable")
+        # asignación al final: las consultas en curso ven la versión anterior entera
+        self.cells, self.lat, self.lon, self.ids = cells[order], lat[order], lon[order], ids[order]
+        self.size = len(order)
+        self.loaded = True
+
+    async def load(self):
+        async with self._lock:
+            docs = await collection.find(
+                {"location": {"$ne": None}}, {"latitude": 1, "longitude": 1}
+            ).to_list(length=None)
+            lat = np.array([d["latitude"] for d in docs], dtype=np.float64)
+            lon = np.array([d["longitude"] for d in docs], dtype=np.float64)
+            ids = np.array([d["_id"].binary for d in docs], dtype="S12")
+            await run_cpu(self.build, lat, lon, ids)
+        invalidate_caches()
+
+    def rows(self, north: float, south: float, east: float, west: float,
+             max_results: Optional[int] = None) -> Optional[np.ndarray]:
+        """
+        Positions of the points inside the bbox (inclusive, antimeridian aware).
+        None as soon as the cells fully inside the bbox alone hold more than
+        max_results points, before any point is filtered.
+        """
+        ranges = [(w, e, *self._cell_xy([south, north], [w, e])) for w, e in lon_ranges(east, west)]
+        if max_results is not None:
+            # celdas interiores (sin las del borde): todos sus puntos están en el
+            # bbox. Se cuentan por tandas de columnas y se corta al pasar de max_results
+            inside = 0
+            for _, _, (cx0, cx1), (cy0, cy1) in ranges:
+                if cy1 - cy0 < 2:
+                    continue
+                for c0 in range(cx0 + 1, cx1, INSIDE_COLUMNS_BATCH):
+                    inner = np.arange(c0, min(c0 + INSIDE_COLUMNS_BATCH, cx1)) * self.ny
+                    inside += int((np.searchsorted(self.cells, inner + cy1 - 1, side="right")
+                                   - np.searchsorted(self.cells, inner + cy0 + 1, side="left")).sum())
+                    if inside > max_results:
+                        return None
+
+        found = []
+        for w, e, (cx0, cx1), (cy0, cy1) in ranges:
+            cols = np.arange(cx0, cx1 + 1)
+            # celdas de una columna consecutivas en el orden: un slice por columna
+            starts = np.searchsorted(self.cells, cols * self.ny + cy0, side="left")
+            ends = np.searchsorted(self.cells, cols * self.ny + cy1, side="right")
+            lengths = ends - starts
+            total = int(lengths.sum())
+            if not total:
+                continue
+            offsets = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+            cand = np.arange(total) + offsets
+            lat, lon = self.lat[cand], self.lon[cand]
+            found.append(cand[(lat >= south) & (lat <= north) & (lon >= w) & (lon <= e)])
+        return np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+
+    def ids_in(self, north: float, south: float, east: float, west: float,
+               max_results: int) -> Optional[list]:
+        """
+        ObjectIds inside the bbox, or None when there are more than max_results
+        (a $in that large is slower than the regular indexed $match).
+        """
+        rows = self.rows(north, south, east, west, max_results)
+        if rows is None or len(rows) > max_results:
+            return None
+        # el dtype S quita los \x00 finales: se restauran los 12 bytes
+        return [ObjectId(bytes(b).ljust(12, b"\x00")) for b in self.ids[rows]]
+
+
+grid_index = GridIndex(cluster_cell_size(SPATIAL_CELL_ZOOM))
+
+
+def active_spatial_index() -> Optional[GridIndex]:
+    if SPATIAL_INDEX and grid_index.loaded:
+        return grid_index
+    return None
+
+
+async def reload_spatial_index():
+    if SPATIAL_INDEX:
+        await grid_index.load()
+
+
+def candidate_ids(north: float, south: float, east: float, west: float) -> Optional[list]:
+    index = active_spatial_index()
+    if index is None:
+        return None
+    return index.ids_in(north, south, east, west, SPATIAL_MAX_CANDIDATES)
@@ -0,0 +1,288 @@
+import itertools
+import math
+from typing import Iterator, Optional
+import numpy as np
+from pymongo import UpdateOne
+from database import aggregate_options, db
+from cache import invalidate_caches
+from executors import run_cpu
+
+# Pirámide de clusters precalculados: una celda por (filtro, zoom, x, y) con
+# sumas aditivas, de modo que una inserción solo incrementa contadores.
+tiles = db["cluster_tiles"]
+
+TILE_ZOOMS = range(0, 16)
+META_ID = "meta"
+# operaciones por bulk_write al actualizar la pirámide tras una ingesta
+TILE_WRITE_BATCH = 10_000
+
+# sumas aditivas por celda; las medias y porcentajes se calculan al leer
+CELL_SUMS = {
+    "total":             {"$sum": 1},
+    "lat_sum":           {"$sum": "$latitude"},
+    "lon_sum":           {"$sum": "$longitude"},
+    "vegan_count":       {"$sum": {"$cond": ["$vegan", 1, 0]}},
+    "gluten_free_count": {"$sum": {"$cond": ["$gluten", 1, 0]}},
+    "rating_sum":        {"$sum": {"$ifNull": ["$valid_rating", 0]}},
+    "rating_count":      {"$sum": {"$cond": [{"$ne": ["$valid_rating", None]}, 1, 0]}},
+    "premium_count":     {"$sum": {"$cond": [{"$eq": ["$price_numeric", 3]}, 1, 0]}},
+    "price_sum":         {"$sum": {"$ifNull": ["$price_numeric", 0]}},
+    "price_count":       {"$sum": {"$cond": [{"$ne": ["$price_numeric", None]}, 1, 0]}},
+}
+
+# claves precalculadas: sin filtros y filtro de un solo país
+KEY_EXPRESSIONS = [
+    {"$literal": "all"},
+    {"$concat": ["country=", {"$toString": {"$ifNull": ["$country", ""]}}]},
+]
+
+# condiciones de $match que solo expresan el bbox
+BBOX_KEYS = ("latitude", "longitude", "location", "$or", "_id")
+
+_ready: Optional[bool] = None
+
+
+def cluster_cell_size(zoom: float) -> float:
+    """
+    Size in degrees of the clustering grid cell for a given zoom level.
+    """
+    if zoom <= 6:
+        max_px = 190
+    elif zoom <= 12:
+        max_px = 120
+    else:
+        max_px = 80
+    deg_px = 360.0 / (256 * (2 ** zoom))
+    return max_px * deg_px
+
+
+def tile_key(match_stage: dict) -> Optional[str]:
+    """
+    Precomputed key for a $match stage, or None when its filters are not tiled.
+    """
+    filters = {k: v for k, v in match_stage.items() if k not in BBOX_KEYS}
+    if not filters:
+        return "all"
+    if list(filters) == ["country"] and isinstance(filters["country"], str):
+        return f"country={filters['country']}"
+    return None
+
+
+def record_keys(record: dict) -> list:
+    country = record.get("country")
+    return ["all", f"country={'' if country is None else country}"]
+
+
+async def tiles_ready() -> bool:
+    global _ready
+    if _ready is None:
+        _ready = await tiles.count_documents({"_id": META_ID}, limit=1) > 0
+    return _ready
+
+
+async def rebuild_cluster_tiles():
+    global _ready
+    _ready = False
+    await tiles.delete_many({})
+    for zoom in TILE_ZOOMS:
+        cell_size = cluster_cell_size(zoom)
+        for key_expr in KEY_EXPRESSIONS:
+            pipeline = [
+                {"$match": {"location": {"$ne": None}}},
+                {"$group": {
+                    "_id": {
+                        "key":  key_expr,
+                        "zoom": zoom,
+                        "x":    {"$floor": {"$divide": [{"$add": ["$longitude", 180]}, cell_size]}},
+                        "y":    {"$floor": {"$divide": [{"$add": ["$latitude",   90]}, cell_size]}},
+                    },
+                    **CELL_SUMS,
+                }},
+                {"$addFields": {"key": "$_id.key", "zoom": "$_id.zoom", "x": "$_id.x", "y": "$_id.y"}},
+                {"$merge": {"into": tiles.name, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}},
+            ]
+            await db["restaurants"].aggregate(pipeline, **aggregate_options(max_time=False)).to_list(length=None)
+    await tiles.replace_one({"_id": META_ID}, {"_id": META_ID, "zooms": list(TILE_ZOOMS)}, upsert=True)
+    _ready = True
+    invalidate_caches()
+    return {"message": "Pirámide de clusters reconstruida", "zooms": list(TILE_ZOOMS)}
+
+
+async def update_cluster_tiles(records: list, removed: list = ()):
+    """
+    Add newly inserted restaurants to the pyramid by incrementing the sums of
+    their cells and subtract `removed` (previous versions of updated documents).
+    Each cell gets a single $inc with its net change, so no cell is left
+    half-updated; cells that end up empty are deleted. The operations are
+    built in the CPU pool and written TILE_WRITE_BATCH at a time.
+    """
+    if not (records or removed) or not await tiles_ready():
+        return
+    emptied: list = []
+    # generador: cada tanda se construye y se escribe antes de la siguiente,
+    # así no se acumulan cientos de miles de UpdateOne en memoria
+    ops = _tile_updates(records, removed, emptied)
+    while batch := await run_cpu(list, itertools.islice(ops, TILE_WRITE_BATCH)):
+        await tiles.bulk_write(batch, ordered=False)
+    if emptied:
+        await tiles.delete_many({"_id": {"$in": emptied}, "total": {"$lte": 0}})
+
+
+# sumas que son recuentos: se escriben como enteros
+COUNT_SUMS = ("total", "vegan_count", "gluten_free_count", "rating_count", "premium_count", "price_count")
+
+
+def _sum_columns(records: list, removed: list) -> tuple:
+    # una fila por documento con posición; los de removed restan (signo -1)
+    rows = [rec for rec in records if rec.get("location")]
+    sign = [1.0] * len(rows)
+    old = [rec for rec in removed if rec.get("location")]
+    rows += old
+    sign += [-1.0] * len(old)
+    sign = np.array(sign)
+    lon = np.array([rec["location"][0] for rec in rows], dtype=float)
+    lat = np.array([rec["location"][1] for rec in rows], dtype=float)
+    rating = [rec.get("valid_rating") for rec in rows]
+    price = [rec.get("price_numeric") for rec in rows]
+    columns = {
+        "total":             np.ones(len(rows)),
+        "lat_sum":           lat,
+        "lon_sum":           lon,
+        "vegan_count":       np.array([bool(rec.get("vegan")) for rec in rows], dtype=float),
+        "gluten_free_count": np.array([bool(rec.get("gluten")) for rec in rows], dtype=float),
+        "rating_sum":        np.array([r or 0 for r in rating], dtype=float),
+        "rating_count":      np.array([r is not None for r in rating], dtype=float),
+        "premium_count":     np.array([p == 3 for p in price], dtype=float),
+        "price_sum":         np.array([p or 0 for p in price], dtype=float),
+        "price_count":       np.array([p is not None for p in price], dtype=float),
+    }
+    keys = [record_keys(rec)[1] for rec in rows]
+    return lon, lat, {field: values * sign for field, values in columns.items()}, keys
+
+
+def _tile_updates(records: list, removed: list, emptied: list) -> Iterator[UpdateOne]:
+    # vectorizado con numpy: 50k filas tocan 16 zooms × 2 claves × 10 sumas
+    lon, lat, columns, country = _sum_columns(records, removed)
+    if not len(lon):
+        return
+    country_keys, country_idx = np.unique(country, return_inverse=True)
+    key_sets = ((["all"], np.zeros(len(lon), dtype=np.int64)), (country_keys.tolist(), country_idx.ravel()))
+    for zoom in TILE_ZOOMS:
+        cell_size = cluster_cell_size(zoom)
+        x = np.floor((lon + 180) / cell_size).astype(np.int64)
+        y = np.floor((lat + 90) / cell_size).astype(np.int64)
+        for keys, key_idx in key_sets:
+            # (clave, x, y) empaquetados en un entero: x e y caben en 20 bits hasta zoom 15
+            packed, inverse = np.unique((key_idx << 40) | (x << 20) | y, return_inverse=True)
+            inverse = inverse.ravel()
+            cells = np.column_stack([packed >> 40, (packed >> 20) & 0xFFFFF, packed & 0xFFFFF])
+            sums = {}
+            for field, values in columns.items():
+                cell_sums = np.bincount(inverse, weights=values, minlength=len(cells))
+                sums[field] = np.rint(cell_sums).astype(np.int64) if field in COUNT_SUMS else cell_sums
+            # un documento que no cambia de celda se compensa: no hace falta escribir
+            changed = np.zeros(len(cells), dtype=bool)
+            for field, cell_sums in sums.items():
+                changed |= cell_sums != 0 if field in COUNT_SUMS else np.abs(cell_sums) > 1e-9
+            fields = list(sums)
+            values = zip(*(sums[field][changed].tolist() for field in fields))
+            for (k, cx, cy), cell in zip(cells[changed].tolist(), values):
+                cell_id = {"key": keys[k], "zoom": zoom, "x": float(cx), "y": float(cy)}
+                inc = dict(zip(fields, cell))
+                if inc["total"] < 0:
+                    emptied.append(cell_id)
+                yield UpdateOne({"_id": cell_id}, {"$inc": inc, "$set": dict(cell_id)}, upsert=True)
+
+
+def tile_to_cluster(t: dict) -> dict:
+    """
+    Same shape as the clusters produced by cluster_facet.
+    """
+    total = t["total"]
+    avg_rating = t["rating_sum"] / t["rating_count"] if t["rating_count"] else None
+    avg_price = t["price_sum"] / t["price_count"] if t["price_count"] else None
+    return {
+        "total_restaurants":  total,
+        "latitude":           round(t["lat_sum"] / total, 6),
+        "longitude":          round(t["lon_sum"] / total, 6),
+        "vegan_count":        t["vegan_count"],
+        "pct_vegan":          round(t["vegan_count"] / total * 100, 2),
+        "gluten_free_count":  t["gluten_free_count"],
+        "pct_gluten_free":    round(t["gluten_free_count"] / total * 100, 2),
+        "avg_rating":         None if avg_rating is None else round(avg_rating, 2),
+        "pct_avg_rating":     None if avg_rating is None else round(avg_rating / 5 * 100, 2),
+        "premium_count":      t["premium_count"],
+        "pct_premium":        round(t["premium_count"] / total * 100, 2),
+        # null < 1.5 en Mongo, igual que el $switch de cluster_facet
+        "avg_price_category": (
+            "barato"  if avg_price is None or avg_price < 1.5 else
+            "regular" if avg_price < 2.5 else
+            "caro"
+        ),
+    }
+
+
+def cluster_columns(sums: dict) -> dict:
+    """
+    Struct-of-arrays version of tile_to_cluster over per-cell arrays of the CELL_SUMS.
+    """
+    s = {k: np.asarray(sums.get(k, ()), dtype=np.float64) for k in CELL_SUMS}
+    total = s["total"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        avg_rating = np.where(s["rating_count"] > 0, s["rating_sum"] / s["rating_count"], np.nan)
+        avg_price = np.where(s["price_count"] > 0, s["price_sum"] / s["price_count"], np.nan)
+
+    def rounded(values: np.ndarray, digits: int) -> list:
+        # round() de Python por valor: mismos números que tile_to_cluster
+        return [None if math.isnan(v) else round(v, digits) for v in values.tolist()]
+
+    def pct(count: np.ndarray) -> list:
+        return rounded(count / total * 100, 2)
+
+    return {
+        "total_restaurants":  total.astype(np.int64).tolist(),
+        "latitude":           rounded(s["lat_sum"] / total, 6),
+        "longitude":          rounded(s["lon_sum"] / total, 6),
+        "vegan_count":        s["vegan_count"].astype(np.int64).tolist(),
+        "pct_vegan":          pct(s["vegan_count"]),
+        "gluten_free_count":  s["gluten_free_count"].astype(np.int64).tolist(),
+        "pct_gluten_free":    pct(s["gluten_free_count"]),
+        "avg_rating":         rounded(avg_rating, 2),
+        "pct_avg_rating":     rounded(avg_rating / 5 * 100, 2),
+        "premium_count":      s["premium_count"].astype(np.int64).tolist(),
+        "pct_premium":        pct(s["premium_count"]),
+        # NaN no es >= 1.5: sin precio cuenta como barato, como en tile_to_cluster
+        "avg_price_category": np.select(
+            [~(avg_price >= 1.5), avg_price < 2.5], ["barato", "regular"], "caro"
+        ).tolist(),
+    }
+
+
+def cells_to_columns(cells: list) -> dict:
+    return cluster_columns({k: [c[k] for c in cells] for k in CELL_SUMS})
+
+
+async def read_cluster_tiles(key: str, zoom: int, north: float, south: float,
+                             east: float, west: float, limit: int, columnar: bool = False):
+    """
+    Clusters of every precomputed cell intersecting the bbox; edge cells are returned whole.
+    With columnar, as struct-of-arrays (cluster_columns).
+    """
+    cell_size = cluster_cell_size(zoom)
+    x_ranges = [
+        {"x": {"$gte": math.floor((w + 180) / cell_size), "$lte": math.floor((e + 180) / cell_size)}}
+        # dos tramos si el viewport cruza el antimeridiano (west > east)
+        for w, e in ([(west, 180.0), (-180.0, east)] if west > east else [(west, east)])
+    ]
+    query = {
+        "key":  key,
+        "zoom": zoom,
+        "y":    {"$gte": math.floor((south + 90) / cell_size), "$lte": math.floor((north + 90) / cell_size)},
+        "$or":  x_ranges,
+        # una celda vaciada por una actualización puede quedar hasta su borrado
+        "total": {"$gt": 0},
+    }
+    cells = await tiles.find(query, {"_id": 0}).limit(limit).to_list(length=limit)
+    if columnar:
+        return cells_to_columns(cells)
+    return [tile_to_cluster(t) for t in cells]
@@ -1,6 +1,15 @@
 from bson import ObjectId
+from datetime import datetime
+from typing import Any
+import hashlib
+import json
 import math
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover - fallback a json de la stdlib
+    orjson = None
+
 def clean_mongo_document(doc: dict) -> dict:
     for key, value in doc.items():
         # 1) ObjectId → str
@@ -30,3 +39,51 @@ def clean_mongo_document(doc: dict) -> dict:
         # resto de tipos (str, int, etc.) se quedan tal cual
 
     return doc
+
+
+def sanitize(obj: Any) -> Any:
+    """
+    Recursively replace NaN or infinite floats with None so JSON serialization won't fail.
+    """
+    if isinstance(obj, dict):
+        return {k: sanitize(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [sanitize(v) for v in obj]
+    if isinstance(obj, float) and (math.isnan(obj) or math.isinf(obj)):
+        return None
+    return obj
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Serialize straight from Mongo documents: NaN/Inf become null and ObjectId
+    becomes str while encoding, without copying the payload first. Uses orjson
+    when available, otherwise sanitize + stdlib json.
+    """
+    if orjson is not None:
+        return orjson.dumps(content, default=_default)
+    return json.dumps(
+        sanitize(content), default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def content_hash(doc: dict) -> str:
+    """
+    sha1 of the canonical JSON of doc (sorted keys, NaN as null): equal content, equal hash.
+    """
+    if orjson is not None:
+        data = orjson.dumps(doc, default=_default, option=orjson.OPT_SORT_KEYS)
+    else:
+        data = json.dumps(
+            sanitize(doc), default=_default, ensure_ascii=False, allow_nan=False,
+            separators=(",", ":"), sort_keys=True,
+        ).encode("utf-8")
+    return hashlib.sha1(data).hexdigest()
@@ -0,0 +1,178 @@
+import time
+from typing import Any, Iterable
+
+from pymongo import ReturnDocument
+
+from database import db
+from executors import run_cpu
+
+# Codificación por diccionario de meals_list, top_tags_list y cuisines_list:
+# los documentos guardan códigos enteros pequeños y las etiquetas viven en
+# los catálogos (items en orden de código). Los diccionarios solo crecen por
+# el final, así un código nunca cambia de etiqueta.
+catalogs = db["catalogs"]
+
+# campo del documento → tipo de catálogo que hace de diccionario
+LIST_CATALOGS = {"meals_list": "meals", "top_tags_list": "tags", "cuisines_list": "cuisines"}
+
+# otros procesos pueden añadir etiquetas: se releen cada REFRESH_SECONDS, y
+# antes si aparece un código o una etiqueta desconocidos (como mucho cada
+# MISS_REFRESH_SECONDS: una etiqueta que no existe no relee en cada petición)
+REFRESH_SECONDS = 30
+MISS_REFRESH_SECONDS = 1
+
+_labels: dict = {field: [] for field in LIST_CATALOGS}
+_codes: dict = {field: {} for field in LIST_CATALOGS}
+_loaded_at = None
+
+
+def normalize_label(value: Any) -> str:
+    return value.strip() if isinstance(value, str) else ""
+
+
+def _set(field: str, items: list):
+    # una lectura más antigua (más corta) no pisa un diccionario ya ampliado
+    if len(items) < len(_labels[field]):
+        return
+    _labels[field] = list(items)
+    _codes[field] = {label: code for code, label in enumerate(items)}
+
+
+async def load_vocabulary(force: bool = False):
+    """
+    Read the dictionaries from the catalogs (at most every REFRESH_SECONDS unless forced).
+    """
+    global _loaded_at
+    now = time.monotonic()
+    if not force and _loaded_at is not None and now - _loaded_at < REFRESH_SECONDS:
+        return
+    docs = await catalogs.find(
+        {"tipo": {"$in": list(LIST_CATALOGS.values())}, "encoded": True}, {"_id": 0, "tipo": 1, "items": 1}
+    ).to_list(length=None)
+    items = {doc["tipo"]: doc.get("items") or [] for doc in docs}
+    for field, tipo in LIST_CATALOGS.items():
+        _set(field, items.get(tipo, []))
+    _loaded_at = now
+
+
+async def _refresh_on_miss():
+    if _loaded_at is None or time.monotonic() - _loaded_at >= MISS_REFRESH_SECONDS:
+        await load_vocabulary(force=True)
+
+
+async def refresh_for_labels(field: str, labels: Iterable[str]):
+    """
+    Re-read the dictionaries when a filter label has no code in this process
+    yet (another worker may have added it since the last read).
+    """
+    codes = _codes[field]
+    if any(label not in codes for label in map(normalize_label, labels)):
+        await _refresh_on_miss()
+
+
+async def refresh_for_codes(field: str, codes: Iterable[Any]):
+    """
+    Re-read the dictionaries when a stored code is past the end of this
+    process' dictionary, before decoding it.
+    """
+    size = len(_labels[field])
+    if any(isinstance(code, int) and code >= size for code in codes):
+        await _refresh_on_miss()
+
+
+async def ensure_codes(field: str, labels: Iterable[str]):
+    """
+    Append the labels without a code to the dictionary of field. The append
+    is one atomic update on the catalog document, so concurrent ingests
+    (also from other processes) never give two codes to one label.
+    """
+    missing = sorted(label for label in set(labels) if label not in _codes[field])
+    if not missing:
+        return
+    # un catálogo anterior a la codificación (sin "encoded") es una lista de
+    # etiquetas sin normalizar, no un diccionario: se sustituye
+    items = {"$cond": [{"$eq": ["$encoded", True]}, {"$ifNull": ["$items", []]}, []]}
+    doc = await catalogs.find_one_and_update(
+        {"tipo": LIST_CATALOGS[field]},
+        [{"$set": {
+            "items": {"$concatArrays": [items, {"$filter": {
+                # $literal: etiquetas que empiezan por "$" no son rutas de campo
+                "input": {"$literal": missing},
+                "cond":  {"$not": [{"$in": ["$$this", items]}]},
+            }}]},
+            "encoded": True,
+            "version": {"$add": [{"$ifNull": ["$version", 0]}, 1]},
+        }}],
+        projection={"_id": 0, "items": 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    _set(field, doc["items"])
+
+
+def _distinct_labels(records: list) -> dict:
+    labels = {field: set() for field in LIST_CATALOGS}
+    for rec in records:
+        for field, values in labels.items():
+            values.update(rec.get(field) or ())
+    return labels
+
+
+def _encode(records: list):
+    for field in LIST_CATALOGS:
+        codes = _codes[field]
+        # parse_unique comparte la lista entre filas iguales: se codifica una vez
+        encoded: dict = {}
+        for rec in records:
+            values = rec.get(field) or []
+            key = id(values)
+            if key not in encoded:
+                encoded[key] = (values, [codes[v] for v in values])
+            rec[field] = encoded[key][1]
+
+
+async def encode_records(records: list):
+    """
+    Replace the (normalized) label lists of records by their codes, adding new labels first.
+    """
+    labels = await run_cpu(_distinct_labels, records)
+    for field, values in labels.items():
+        await ensure_codes(field, values)
+    await run_cpu(_encode, records)
+
+
+def encode_labels(field: str, labels: list) -> list:
+    """
+    Codes of the labels of a filter. Unknown labels stay as text: they match
+    no document and still give different filters different cache keys.
+    """
+    codes = _codes[field]
+    return [codes.get(label, label) for label in map(normalize_label, labels)]
+
+
+def decode(field: str, code: Any) -> Any:
+    labels = _labels[field]
+    if isinstance(code, int) and 0 <= code < len(labels):
+        return labels[code]
+    return code
+
+
+def decode_items(field: str, items: list, label: str) -> list:
+    """
+    Distribution items ({label: code, "count": n}) back to labels, in place.
+    """
+    for item in items:
+        item[label] = decode(field, item[label])
+    return items
+
+
+def decode_lists(field: str, docs: list) -> list:
+    for doc in docs:
+        values = doc.get(field)
+        if isinstance(values, list):
+            doc[field] = [decode(field, v) for v in values]
+    return docs
+
+
+def vocabulary_labels(field: str) -> list:
+    return list(_labels[field])